@@ -1,4 +1,5 @@
 import argparse
+import re
 import sys
 from typing import List, Type, Dict
 from enum import Enum
@@ -7,6 +8,7 @@ from pyzotero import zotero
 
 from library_collections.document import Document
 from utils.general_utils import read_yaml_config
+from utils.near_duplicates import NearDuplicateIndex
 
 
 def setup_argparse():
@@ -120,30 +122,36 @@ def update_doc_collections(z_library, doc_data: Dict, remove: Dict=None, add: Di
         doc_data["data"]["title"], remove.keys(), remove.keys()))
 
 ### Misc
-def remove_duplicates(z_library):
-    """deletes duplicate documents found in Zotero. Conservatively, based on DOI and ISSN
-    and abstract with no normalisation etc"""
-    dois, issns, abstracts = set(), set(), set()
+def remove_duplicates(z_library, dry_run: bool = True) -> Dict[str, List[List[Dict]]]:
+    """finds near-duplicate documents in Zotero, within each collection: those with the same DOI, or
+    near-identical titles and abstracts despite differences in casing, punctuation or truncation, as long as
+    their DOIs and years don't differ (see utils/near_duplicates.py). Every group found is printed, and unless
+    dry_run, all but its first document are deleted. Returns the groups found in each collection, keyed by
+    collection ID"""
     collections = z_library.collections()
     collection_ids =  get_collection_IDs(collections)
+    clusters = {}
     for col_id in collection_ids: # don't erase duplicates ACROSS collections
         all_docs = get_all_docs(z_library, col_id)
-        deleted = 0
-        for doc in all_docs:
+        index = NearDuplicateIndex()
+        for i, doc in enumerate(all_docs):
             data = doc["data"]
-            doi, issn, abstract = data.get("DOI"), data.get("ISSN"), data.get("abstractNote")
-            if doi in dois or issn in issns or abstract in abstracts:
-                z_library.delete_item(doc)
+            year = re.search(r"\b\d{4}\b", data.get("date") or "")
+            index.add(i, data.get("title"), data.get("abstractNote"), doi=data.get("DOI"),
+                      year=year.group() if year else None)
+        clusters[col_id] = [[all_docs[i] for i in cluster] for cluster in index.clusters()]
+        deleted = 0
+        for cluster in clusters[col_id]:
+            print("Keeping {} '{}', {} {}".format(cluster[0]["key"], cluster[0]["data"].get("title"),
+                                                  "would delete" if dry_run else "deleting",
+                                                  ", ".join(doc["key"] for doc in cluster[1:])), file=sys.stderr)
+            for doc in cluster[1:]:
+                if not dry_run:
+                    z_library.delete_item(doc)
                 deleted += 1
-            else: # check that exist so don't add empty strings
-                if doi:
-                    dois.add(doi)
-                if issn:
-                    issns.add(issn)
-                if abstract:
-                    abstracts.add(abstract)
-        print("{} docs were duplicates in collection {}".format(deleted, col_id), file=sys.stderr)
-        #TODO write these documents to logs
+        print("{} docs were duplicates in collection {}{}".format(deleted, col_id, " (dry run)" if dry_run else ""),
+              file=sys.stderr)
+    return clusters
 
 
 def metadata_pretty_print(item):
@@ -0,0 +1,151 @@
+"""
+Measures how fast grab.GrabAll downloads against the local publisher fixtures in publishers.py.
+
+The fixture server runs in its own process, so the timings, CPU and peak RSS reported are
+those of the downloader alone. Reports results/sec, p50/p99 seconds per result, bytes/sec
+and peak RSS, e.g.
+
+    python -m benchmarks.grab_benchmark -n 500 -workers 16 -per_host 4 -latency 0.05 -throttle_rate 0.02
+"""
+import json
+import time
+import types
+import resource
+import argparse
+import tempfile
+import multiprocessing
+
+from retrieval import grab, web
+
+from .publishers import FixtureServer, FixtureAdapter, STATS_HOST, make_results
+
+
+def serve(ports, kwargs):
+    server = FixtureServer(**kwargs)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+class TimedGrabAll(grab.GrabAll):
+    """
+    GrabAll that records how long each result took.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.durations = []
+
+    def grab(self, result):
+        start = time.perf_counter()
+
+        try:
+            super().grab(result)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    :param values: numbers to take the percentile of
+    :param p: percentile, 0-100
+    :return: the nearest-rank percentile, or 0.0 for no values
+    """
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def run_benchmark(n: int = 200, workers: int = 8, per_host: int = 4, host_rate: float = 1000.0,
+                  output_folder: str = None, **fixture) -> dict:
+    """
+    :param n: number of results to download
+    :param workers: passed to GrabAll
+    :param per_host: passed to GrabAll
+    :param host_rate: passed to GrabAll. High by default, so the rate limiter isn't what's measured.
+    :param output_folder: where to save the PDFs. A temporary folder by default.
+    :param fixture: passed to publishers.FixtureServer, e.g. latency, error_rate, throttle_rate, pdf_size
+    :return: dict of measurements
+    """
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(ports, fixture), daemon=True)
+    server.start()
+
+    try:
+        port = ports.get(timeout=30)
+
+        output_folder = output_folder or tempfile.mkdtemp(prefix='grab_benchmark_')
+        searcher = types.SimpleNamespace(label='benchmark', data={'metadata': {'source': 'fixture'},
+                                                                   'results': make_results(n)})
+
+        g = TimedGrabAll(searcher, output_folder, workers=workers, per_host=per_host, resume=False,
+                         host_rate=host_rate)
+
+        # GrabAll has just rebuilt the shared session, so the fixture adapter goes on the new one
+        adapter = FixtureAdapter(port, pool_connections=web.POOL_HOSTS, pool_maxsize=per_host)
+        web.SESSION.mount('http://', adapter)
+        web.SESSION.mount('https://', adapter)
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        g.run()
+
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        stats = web.SESSION.get(f'http://{STATS_HOST}/').json()
+    finally:
+        server.terminate()
+        server.join()
+
+    failures = g.ledger.counts
+
+    return {'results': n,
+            'downloaded': n - sum(failures.values()),
+            'failures': failures,
+            'workers': workers,
+            'per_host': per_host,
+            'seconds': round(elapsed, 3),
+            'cpu_seconds': round(cpu, 3),
+            'results_per_sec': round(n / elapsed, 2),
+            'p50_seconds': round(percentile(g.durations, 50), 4),
+            'p99_seconds': round(percentile(g.durations, 99), 4),
+            'bytes_per_sec': round(stats['bytes'] / elapsed),
+            'requests': stats['requests'],
+            'server_errors': stats['errors'],
+            'throttled': stats['throttled'],
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'output_folder': output_folder}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-n', type=int, default=200, help='Number of results to download')
+    parser.add_argument('-workers', type=int, default=8)
+    parser.add_argument('-per_host', type=int, default=4)
+    parser.add_argument('-host_rate', type=float, default=1000.0, help='Requests per second each host starts out allowed')
+    parser.add_argument('-latency', type=float, default=0.02, help='Seconds added to every response')
+    parser.add_argument('-jitter', type=float, default=0.0, help='Up to this many extra seconds per response, at random')
+    parser.add_argument('-error_rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('-throttle_rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('-page_kb', type=int, default=100, help='Size of each landing page')
+    parser.add_argument('-pdf_kb', type=int, default=200, help='Size of each PDF')
+    parser.add_argument('-output_folder', type=str, help='Where to save the PDFs. A temporary folder by default')
+    parser.add_argument('-json', type=str, help='Also save the measurements to this file')
+
+    args = parser.parse_args()
+
+    report = run_benchmark(n=args.n, workers=args.workers, per_host=args.per_host, host_rate=args.host_rate,
+                           output_folder=args.output_folder, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                           page_size=args.page_kb * 1024, pdf_size=args.pdf_kb * 1024)
+
+    print(json.dumps(report, indent=5))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=5)
@@ -0,0 +1,342 @@
+"""
+Local stand-in for dx.doi.org and the publisher sites that retrieval/grab.py knows about, so that
+downloading can be measured without depending on (or hammering) real publishers.
+
+One HTTP server answers for every host. Requests are routed by their Host header, and
+FixtureAdapter sends every URL requested through a requests.Session to the server with
+the original host in that header, so grabbers see the real-looking URLs they are written for,
+e.g. https://link.springer.com/article/10.5555/springer.3.
+
+Each publisher layout mimics the part of the real site a grabber depends on:
+
+    springer       link.springer.com                citation_pdf_url meta tag in the <head> (CitationPDFURL)
+    springer_body  rd.springer.com                  citation_pdf_url only after the <head> (SpringerGrabber)
+    wiley          onlinelibrary.wiley.com          citation_pdf_url to /doi/pdf/, PDF also at /doi/pdfdirect/
+                                                    (CitationPDFURL)
+    wiley_body     agupubs.onlinelibrary.wiley.com  citation_pdf_url to /doi/pdf/ only after the <head>, which is
+                                                    a ReadCube reader page, so the PDF is only at /doi/pdfdirect/
+                                                    (WileyGrabber)
+    nih            www.ncbi.nlm.nih.gov             <link type="application/pdf"> and no meta tag (NIHGrabber)
+    citation       journals.example.org             citation_pdf_url on an unregistered host (CitationPDFURL)
+    direct         files.example.org                the result URL is the PDF itself (BaseGrabber)
+
+A citation_pdf_url in the <head> is picked up before any publisher grabber is chosen, so the
+*_body layouts are the ones that exercise SpringerGrabber and WileyGrabber, which parse the whole page.
+
+Results point at http://dx.doi.org/10.5555/<layout>.<n>, which redirects to the landing page
+like the real resolver. Latency, server errors and 429s can be added to every response.
+
+Run on its own with `python -m benchmarks.publishers -port 8000`, or see grab_benchmark.py.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+LAYOUTS = ('springer', 'springer_body', 'wiley', 'wiley_body', 'nih', 'citation', 'direct')
+
+HOSTS = {'springer': 'link.springer.com',
+         'springer_body': 'rd.springer.com',
+         'wiley': 'onlinelibrary.wiley.com',
+         'wiley_body': 'agupubs.onlinelibrary.wiley.com',
+         'nih': 'www.ncbi.nlm.nih.gov',
+         'citation': 'journals.example.org',
+         'direct': 'files.example.org'}
+
+DOI_HOST = 'dx.doi.org'
+
+# Host the fixture's own request counters are served from
+STATS_HOST = 'fixture.local'
+
+DOI_PREFIX = '10.5555'
+
+
+def landing_url(layout: str, doi: str) -> str:
+    """
+    :param layout: one of LAYOUTS
+    :param doi: e.g. 10.5555/springer.3
+    :return: the URL dx.doi.org redirects the DOI to
+    """
+    host = HOSTS[layout]
+
+    if layout in ('springer', 'springer_body'):
+        return f'https://{host}/article/{doi}'
+    if layout in ('wiley', 'wiley_body'):
+        return f'https://{host}/doi/{doi}'
+    if layout == 'nih':
+        return f'https://{host}/pmc/articles/PMC{doi.split(".")[-1]}/'
+    if layout == 'citation':
+        return f'https://{host}/article/{doi}'
+
+    return f'https://{host}/{doi}.pdf'
+
+
+def make_results(n: int) -> list:
+    """
+    :param n: number of results
+    :return: search results in the shape search.Query produces, cycling through LAYOUTS
+    """
+    results = []
+
+    for i in range(n):
+        doi = f'{DOI_PREFIX}/{LAYOUTS[i % len(LAYOUTS)]}.{i}'
+
+        results.append({'title': f'Fixture paper {i}',
+                        'DOI': doi,
+                        'url': f'http://{DOI_HOST}/{doi}',
+                        'saved_pdf_name': f'{doi.replace("/", "_")}.pdf'})
+
+    return results
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, page_size: int = 100 * 1024,
+                 pdf_size: int = 200 * 1024, seed: int = 0):
+        """
+        :param port: port to listen on, 0 for any free one
+        :param latency: seconds added before every response
+        :param jitter: up to this many extra seconds added at random
+        :param error_rate: fraction of requests answered with 500
+        :param throttle_rate: fraction of requests answered with 429 and a Retry-After header
+        :param retry_after: seconds asked for by those 429s
+        :param page_size: approximate size of a landing page in bytes, mostly script after the </head>
+        :param pdf_size: size of each PDF in bytes
+        :param seed: seed for the random latency and failures, so runs can be repeated
+        """
+        super().__init__(('127.0.0.1', port), FixtureHandler)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.pdf_size = pdf_size
+
+        self.random = random.Random(seed)
+
+        self.stats = {'requests': 0, 'bytes': 0, 'errors': 0, 'throttled': 0, 'pdfs': 0}
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hang up part way through on purpose, e.g. once they have a landing page's <head>
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def roll(self):
+        """
+        :return: (seconds to wait, status to fail with or None)
+        """
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            dice = self.random.random()
+
+        if dice < self.error_rate:
+            return delay, 500
+        if dice < self.error_rate + self.throttle_rate:
+            return delay, 429
+
+        return delay, None
+
+    def count(self, **counts):
+        with self.lock:
+            for key, n in counts.items():
+                self.stats[key] += n
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        host = self.headers.get('host', '').split(':')[0].lower()
+        path = urlsplit(self.path).path
+
+        if host == STATS_HOST:
+            return self.send(200, json.dumps(self.server.stats).encode(), 'application/json')
+
+        delay, failure = self.server.roll()
+        time.sleep(delay)
+
+        if failure == 429:
+            self.server.count(throttled=1)
+            return self.send(429, b'', 'text/plain', {'Retry-After': str(self.server.retry_after)})
+        if failure:
+            self.server.count(errors=1)
+            return self.send(failure, b'', 'text/plain')
+
+        if host == DOI_HOST:
+            doi = path.lstrip('/')
+            layout = doi.split('/')[-1].split('.')[0]
+
+            if layout not in HOSTS:
+                return self.send(404, b'DOI Not Found', 'text/plain')
+
+            return self.send(302, b'', 'text/plain', {'Location': landing_url(layout, doi)})
+
+        for layout, layout_host in HOSTS.items():
+            if host == layout_host:
+                return getattr(self, layout)(path)
+
+        self.send(404, b'', 'text/plain')
+
+    def springer(self, path):
+        if path.startswith('/content/pdf/'):
+            return self.pdf(path)
+
+        doi = path[len('/article/'):]
+
+        self.page(meta={'citation_pdf_url': f'https://{HOSTS["springer"]}/content/pdf/{doi}.pdf',
+                        'citation_doi': doi})
+
+    def springer_body(self, path):
+        if path.startswith('/content/pdf/'):
+            return self.pdf(path)
+
+        doi = path[len('/article/'):]
+
+        self.page(body_meta={'citation_pdf_url': f'https://{HOSTS["springer_body"]}/content/pdf/{doi}.pdf',
+                             'citation_doi': doi})
+
+    def wiley(self, path):
+        if path.startswith('/doi/pdfdirect/') or path.startswith('/doi/pdf/'):
+            return self.pdf(path)
+
+        doi = path[len('/doi/'):]
+
+        self.page(meta={'citation_pdf_url': f'https://{HOSTS["wiley"]}/doi/pdf/{doi}', 'citation_doi': doi})
+
+    def wiley_body(self, path):
+        if path.startswith('/doi/pdfdirect/'):
+            return self.pdf(path)
+        if path.startswith('/doi/pdf/'):
+            # The ReadCube reader, which renders the PDF with JavaScript
+            return self.page()
+
+        doi = path[len('/doi/'):]
+
+        self.page(body_meta={'citation_pdf_url': f'https://{HOSTS["wiley_body"]}/doi/pdf/{doi}',
+                             'citation_doi': doi})
+
+    def nih(self, path):
+        if path.endswith('.pdf'):
+            return self.pdf(path)
+
+        # NIHGrabber joins the href onto https://www.ncbi.nlm.nih.gov/
+        self.page(links=[f'pmc/articles/{path.strip("/").split("/")[-1]}/pdf/main.pdf'])
+
+    def citation(self, path):
+        if path.endswith('.pdf'):
+            return self.pdf(path)
+
+        doi = path[len('/article/'):]
+
+        self.page(meta={'citation_pdf_url': f'https://{HOSTS["citation"]}/pdf/{doi}.pdf', 'citation_doi': doi})
+
+    def direct(self, path):
+        self.pdf(path)
+
+    def page(self, meta: dict = None, links: list = None, body_meta: dict = None):
+        """
+        :param meta: meta tags for the <head>
+        :param links: hrefs of PDF <link>s for the <head>
+        :param body_meta: meta tags put at the start of the <body> instead, where only a full parse finds them
+        """
+        head = ['<!DOCTYPE html><html><head><title>Fixture paper</title>']
+        head += [f'<meta name="{name}" content="{content}">' for name, content in (meta or {}).items()]
+        head += [f'<link rel="alternate" type="application/pdf" href="{href}">' for href in (links or [])]
+        head.append('</head><body>')
+        head += [f'<meta name="{name}" content="{content}">' for name, content in (body_meta or {}).items()]
+
+        body = ''.join(head).encode()
+        filler = b'<script>var x = "publisher analytics and widgets";</script>\n'
+        body += filler * max(0, (self.server.page_size - len(body)) // len(filler)) + b'</body></html>'
+
+        self.send(200, body, 'text/html; charset=utf-8')
+
+    def pdf(self, path):
+        # Different content for every path, so a PDFStore doesn't treat them as one paper
+        seed = path.encode()
+        block = (seed + b' ') * (1024 // (len(seed) + 1) + 1)
+        body = b'%PDF-1.4\n' + block * (self.server.pdf_size // len(block) + 1)
+        body = body[:self.server.pdf_size]
+
+        self.server.count(pdfs=1)
+        self.send(200, body, 'application/pdf', {'Accept-Ranges': 'bytes'})
+
+    def send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client stopped reading, e.g. once it had a landing page's <head>
+            self.close_connection = True
+            return
+
+        self.server.count(requests=1, bytes=len(body))
+
+
+class FixtureAdapter(HTTPAdapter):
+    """
+    Sends every request to the fixture server, keeping the URL's host in the Host header.
+    Mount it on a requests.Session for both 'http://' and 'https://'.
+    """
+    def __init__(self, port: int, **kwargs):
+        self.port = port
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+
+        local = request.copy()
+        local.url = url._replace(scheme='http', netloc=f'127.0.0.1:{self.port}').geturl()
+        local.headers['Host'] = url.hostname
+
+        r = super().send(local, **kwargs)
+
+        # Make the response look like it came from where it was asked for, so redirects and
+        # grabbers that look at r.url behave as they would against the real site
+        r.url = request.url
+        r.request = request
+
+        return r
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-port', type=int, default=8000)
+    parser.add_argument('-latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('-jitter', type=float, default=0.0, help='Up to this many extra seconds, at random')
+    parser.add_argument('-error_rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('-throttle_rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('-page_kb', type=int, default=100, help='Size of each landing page')
+    parser.add_argument('-pdf_kb', type=int, default=200, help='Size of each PDF')
+
+    args = parser.parse_args()
+
+    server = FixtureServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           throttle_rate=args.throttle_rate, page_size=args.page_kb * 1024,
+                           pdf_size=args.pdf_kb * 1024)
+
+    print(f'Serving publisher fixtures on 127.0.0.1:{server.server_port}')
+    server.serve_forever()
@@ -9,6 +9,7 @@ from dateutil import parser
 
 from api.citoid_api import get_citation_data
 from utils.general_utils import make_id, bool_partition, save_pkl, load_pkl, make_pdf_name
+from retrieval.results import SavedResults
 
 
 class TextType(Enum):
@@ -270,22 +271,44 @@ class Document(object):
             "scopus" : cls.doc_from_scopus_json,
             "wos" : cls.doc_from_wos_json,
             "pubmed": cls.doc_from_pubmed_json,
+            "google_scholar": cls.doc_from_json,
             None: cls.doc_from_json
                        }
 
-        with open(filepath, "r") as fin:
-            data = json.load(fin)
-        doc_source = data.get("metadata").get("source").lower()
-        data = data["results"] if doc_source else data # all special sources have a degree of nesting
-        # skip json if no data
-        if not data:
+        def from_merged(doc, basedir):
+            """results merged across engines (retrieval/dedup.py) are read by the first of their sources with a reader"""
+            for source in doc.get("sources", []):
+                reader = source2func.get((source.get("source") or "").lower())
+                if reader is not None and reader is not from_merged:
+                    return reader(doc, basedir=basedir)
+            logging.debug("No reader for any source of merged result: {}".format(doc.get("sources")))
             return None
 
-        documents, failed = [], 0
+        source2func["merged"] = from_merged
+
+        if filepath.lower().endswith(".jsonl"):
+            # results are read and turned into Documents one line at a time
+            saved = SavedResults(filepath)
+            doc_source = saved.data["metadata"].get("source").lower()
+            data = saved.iter_results()
+            if not batch:
+                data = list(data)
+        else:
+            with open(filepath, "r") as fin:
+                data = json.load(fin)
+            doc_source = data.get("metadata").get("source").lower()
+            data = data["results"] if doc_source else data # all special sources have a degree of nesting
+            # skip json if no data
+            if not data:
+                return None
+
+        documents, failed, total = [], 0, 1
         basedir, filename = os.path.split(filepath)
         if batch:
-            logging.info("Processing {} docs...".format(len(data)))
+            logging.info("Processing {} docs...".format(len(data) if isinstance(data, list) else "streamed"))
+            total = 0
             for doc in data:
+                total += 1
                 new_doc = source2func[doc_source](doc, basedir=basedir)
                 if new_doc:
                     documents.append(new_doc)
@@ -300,14 +323,18 @@ class Document(object):
                 documents = [new_doc]
             else:
                 logging.debug("Failed to create doc from data: {}".format(data))
+        if not total:
+            return None
         logging.info("{} documents failed to retrieve metadata and were skipped, "
-              "out of {} total ({:2f}) %".format(failed, len(data), (failed/len(data))*100))
+              "out of {} total ({:2f}) %".format(failed, total, (failed/total)*100))
         return documents if documents else None
 
     @classmethod
     def doc_from_json(cls, data: dict, basedir: str):
         """default creates a doc from json - based on Google Scholar format"""
-        resource_url = data["bib"]["url"]
+        # older Google Scholar results keep their fields under "bib", SerpApi ones (retrieval/search.py) at the top
+        bib = data.get("bib", data)
+        resource_url = bib["url"]
         citation_data = get_citation_data(resource_url) # this is a dict
 
         filename = data.get("saved_pdf_name", "")
@@ -319,11 +346,11 @@ class Document(object):
         new_doc = Document(source=citation_data.get("itemType", ""),
                            file_type=FileType.pdf,
                            url=resource_url, filepath=filepath)
-        title = data["bib"].get("title")
-        year = data["bib"].get("year")
+        title = bib.get("title")
+        year = bib.get("year")
         new_doc.title = title if title else citation_data.get("title")
         new_doc.year = int(year) if year else get_year_from_date(citation_data.get("date"))
-        new_doc.authors = make_authors(citation_data.get("creators", []), data["bib"]["author"])
+        new_doc.authors = make_authors(citation_data.get("creators", []), bib.get("author", ""))
         new_doc.set_info_from_citation(citation_data)
 
         return new_doc
@@ -1,4 +1,5 @@
 from .grab import download
+from . import cassette, dedup, results, schedule
 from .search import GoogleScholar, WoS, Scopus, PubMed
 
 engines = {'google': GoogleScholar,
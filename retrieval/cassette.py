@@ -0,0 +1,219 @@
+"""
+Record every HTTP exchange made through `requests` to a cassette file and play it back later
+without any network access.
+
+Installing a Cassette patches requests' HTTPAdapter.send, so it catches the search engines that
+are built on requests (SerpApi, pybliometrics, pymed), GrabOne's downloads through web.py and
+api.citoid_api alike. Web of Science goes through suds, which doesn't use requests, so it isn't
+recorded.
+
+    with Cassette('runs/brucellosis.cassette', mode=RECORD):
+        searcher.run()
+        download(searcher, 'pdfs/')
+
+The cassette is a single SQLite file. Response bodies are zlib-compressed. Requests are
+matched on method, URL and body, with API keys left out of the URL. A request made more than
+once (e.g. retried after a 429) replays its responses in the order they were recorded and
+then keeps repeating the last one. Request headers and cookies are never stored.
+"""
+import io
+import json
+import zlib
+import sqlite3
+import hashlib
+import datetime
+import threading
+import requests
+
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+RECORD = 'record'    # always use the network and (re)record what comes back
+REPLAY = 'replay'    # never use the network; a request that isn't in the cassette fails with CassetteMiss
+AUTO = 'auto'        # replay what's in the cassette and record anything that isn't
+
+MODES = (RECORD, REPLAY, AUTO)
+
+# Query parameters that hold credentials. They are left out when matching requests, so a cassette
+# recorded with one key replays with another (or none), and never end up in the cassette.
+SECRET_PARAMS = {'api_key', 'apikey', 'key', 'token', 'access_token', 'insttoken'}
+
+# Response headers that aren't worth keeping or no longer apply once the body has been decoded
+DROPPED_HEADERS = {'set-cookie', 'content-encoding', 'transfer-encoding', 'content-length'}
+
+
+class CassetteMiss(requests.RequestException):
+    """
+    Raised in REPLAY mode for a request the cassette has no recording of.
+    """
+
+
+def strip_secrets(url: str) -> str:
+    """
+    :param url: any URL
+    :return: the URL without SECRET_PARAMS and with its query parameters in a fixed order
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in SECRET_PARAMS)
+
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+def request_key(request) -> str:
+    """
+    :param request: requests.PreparedRequest
+    :return: key the request is recorded and looked up under
+    """
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode()
+
+    return hashlib.sha256(b'\n'.join([request.method.encode(),
+                                      strip_secrets(request.url).encode(),
+                                      body if isinstance(body, bytes) else b''])).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = AUTO):
+        """
+        :param path: cassette file. Created if it doesn't exist.
+        :param mode: RECORD, REPLAY or AUTO
+        """
+        if mode not in MODES:
+            raise ValueError(f'Cassette mode must be one of {MODES}, not {mode!r}')
+
+        self.path = Path(path).expanduser()
+        self.mode = mode
+
+        self.recorded = 0
+        self.replayed = 0
+
+        # key -> number of times it has been requested since the cassette was installed
+        self._played = {}
+        self._original_send = None
+
+        if mode == REPLAY and not self.path.is_file():
+            raise FileNotFoundError(f'No cassette at {self.path} to replay')
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._db.execute('CREATE TABLE IF NOT EXISTS exchanges ('
+                         'key TEXT NOT NULL, '
+                         'seq INTEGER NOT NULL, '
+                         'method TEXT, '
+                         'url TEXT, '
+                         'status INTEGER, '
+                         'reason TEXT, '
+                         'headers TEXT, '
+                         'body BLOB, '
+                         'PRIMARY KEY (key, seq))')
+        self._db.commit()
+
+    def install(self):
+        """
+        Starts recording or replaying every request sent with requests.
+        """
+        cassette = self
+        original_send = HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            return cassette.send(original_send, adapter, request, **kwargs)
+
+        self._original_send = original_send
+        HTTPAdapter.send = send
+
+    def uninstall(self):
+        if self._original_send is not None:
+            HTTPAdapter.send = self._original_send
+            self._original_send = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+        self.close()
+
+    def send(self, original_send, adapter, request, **kwargs):
+        key = request_key(request)
+
+        with self._lock:
+            seq = self._played.get(key, 0)
+            self._played[key] = seq + 1
+
+        if self.mode != RECORD:
+            r = self.replay(key, seq, adapter, request)
+
+            if r is not None:
+                return r
+
+            if self.mode == REPLAY:
+                raise CassetteMiss(f'No recording of {request.method} {strip_secrets(request.url)} in {self.path}',
+                                   request=request)
+
+        r = original_send(adapter, request, **kwargs)
+
+        self.record(key, seq, request, r)
+
+        return r
+
+    def record(self, key: str, seq: int, request, r):
+        # Reading the body here also means a streamed response is no longer streamed while recording
+        body = r.content
+        headers = {k: v for k, v in r.headers.items() if k.lower() not in DROPPED_HEADERS}
+
+        with self._lock:
+            if seq == 0:
+                # Re-recording: drop whatever an earlier run stored for this request
+                self._db.execute('DELETE FROM exchanges WHERE key = ?', (key,))
+
+            self._db.execute('INSERT OR REPLACE INTO exchanges (key, seq, method, url, status, reason, headers, body) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, seq, request.method, strip_secrets(request.url), r.status_code, r.reason,
+                              json.dumps(headers), zlib.compress(body)))
+            self._db.commit()
+
+            self.recorded += 1
+
+    def replay(self, key: str, seq: int, adapter, request):
+        """
+        :return: the seq'th recorded response to the request (or the last one, if there are fewer), or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT status, reason, headers, body FROM exchanges '
+                                   'WHERE key = ? AND seq <= ? ORDER BY seq DESC LIMIT 1', (key, seq)).fetchone()
+
+            if row is None:
+                return None
+
+            self.replayed += 1
+
+        status, reason, headers, body = row
+        body = zlib.decompress(body)
+
+        r = requests.Response()
+        r.status_code = status
+        r.reason = reason
+        r.headers = CaseInsensitiveDict(json.loads(headers))
+        r.headers['Content-Length'] = str(len(body))
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.raw = io.BytesIO(body)
+        r._content = body
+        r._content_consumed = True
+        r.url = request.url
+        r.request = request
+        r.connection = adapter
+        r.elapsed = datetime.timedelta(0)
+
+        return r
+
+    def close(self):
+        with self._lock:
+            self._db.close()
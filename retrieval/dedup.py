@@ -0,0 +1,288 @@
+"""
+Merge the results files of one topic searched on several engines, so that each paper is downloaded
+and looked up on Citoid once rather than once per engine that found it.
+
+Results are matched on any of their normalised DOI, PubMed ID, or title and publication year, and
+matches are transitive: a WoS record sharing a DOI with a Scopus record that shares a PMID with a
+PubMed record makes one paper. Each paper becomes one canonical record, the copy most likely to
+download (one with a DOI, then one with any URL) with the gaps in its fields filled in from the
+other copies, and with a 'sources' list saying which engines and files it came from.
+
+After the exact matching, the papers' titles and abstracts are compared with MinHash LSH (see
+utils/near_duplicates.py), which catches copies whose titles differ in casing, punctuation, markup or
+a truncated abstract. Near-duplicates whose publication years are both known and differ are kept apart.
+
+The merged file has 'merged' as its metadata source. It can be downloaded with
+retrieve.py -mode download and read with Document.from_json, which handles each record according to
+the engine of its first source.
+"""
+import re
+import json
+import datetime
+
+from pathlib import Path
+
+from utils.near_duplicates import NearDuplicateIndex
+
+from .doi_cache import normalise_doi
+from .results import ResultsWriter, read_results, is_jsonl
+from .screen import ABSTRACT_FIELDS
+
+MERGED = 'merged'
+
+# Fields that hold a DOI, a PubMed ID, or the publication date or year, in each engine's results
+DOI_FIELDS = ('doi', 'DOI', 'Identifier.Doi', 'Identifier.Xref_Doi')
+PMID_FIELDS = ('pubmed_id', 'Identifier.Pmid', 'pmid')
+YEAR_FIELDS = ('publication_date', 'coverDate', 'Published.BiblioYear', 'year', 'publication_info')
+
+# Titles with fewer words than this ('Editorial', 'Brucellosis') are too generic to match on
+MIN_TITLE_WORDS = 4
+
+_YEAR = re.compile(r'\b(19|20)\d{2}\b')
+
+
+def _first(result: dict, fields: tuple):
+    for field in fields:
+        value = result.get(field)
+
+        if isinstance(value, dict):
+            # e.g. Google Scholar's publication_info: {'summary': 'A Author - Journal, 2018 - publisher'}
+            value = value.get('summary')
+
+        if value and value != 'None':
+            return str(value)
+
+    return None
+
+
+def normalise_title(title: str) -> str:
+    """
+    :return: the title lower-cased, with punctuation and markup dropped and whitespace collapsed
+    """
+    title = re.sub(r'<[^>]+>', ' ', title or '')
+
+    return ' '.join(re.findall(r'\w+', title.lower()))
+
+
+def keys_for(result: dict) -> list:
+    """
+    :param result: a search result from any engine
+    :return: the keys it is matched to other results on: 'doi:...', 'pmid:...' and 'title:...:<year>'
+    """
+    keys = []
+
+    doi = _first(result, DOI_FIELDS)
+    if doi is None and 'doi.org/' in (result.get('url') or '') and not result['url'].endswith('/None'):
+        doi = result['url']
+    if doi:
+        keys.append('doi:' + normalise_doi(doi))
+
+    pmid = _first(result, PMID_FIELDS)
+    if pmid:
+        # pymed joins several IDs with newlines; the first is the article's own
+        pmid = pmid.split()[0]
+        if pmid.isdigit():
+            keys.append('pmid:' + pmid)
+
+    title = normalise_title(result.get('title'))
+    year = year_of(result)
+    if len(title.split()) >= MIN_TITLE_WORDS and year:
+        keys.append(f'title:{title}:{year}')
+
+    return keys
+
+
+def year_of(result: dict):
+    """
+    :return: the result's publication year as a string, or None if it isn't known
+    """
+    year = _YEAR.search(_first(result, YEAR_FIELDS) or '')
+
+    return year.group() if year else None
+
+
+def rank(result: dict) -> int:
+    """
+    :return: how good a canonical record the result makes, lower is better
+    """
+    url = result.get('url') or 'http://none'
+
+    if 'doi.org/' in url and not url.endswith('/None'):
+        return 0
+    if url.lower() != 'http://none':
+        return 1
+
+    return 2
+
+
+class DedupIndex:
+    def __init__(self):
+        # group id -> records in the group, each a (result, sources) pair. Ids are in order of first appearance.
+        self.groups = {}
+
+        # key -> group id it was first seen in
+        self._keys = {}
+        # group id -> the group it has been merged into, if any
+        self._parent = {}
+
+        self.added = 0
+
+    def _find(self, group: int) -> int:
+        while self._parent.get(group, group) != group:
+            group = self._parent[group]
+
+        return group
+
+    def _union(self, group: int, other: int) -> int:
+        """
+        :return: the id of the merged group
+        """
+        group, other = self._find(group), self._find(other)
+
+        if other == group:
+            return group
+
+        # Keep the earlier group's id, so output stays in order of first appearance
+        first, second = min(other, group), max(other, group)
+
+        self.groups[first] += self.groups.pop(second)
+        self._parent[second] = first
+
+        return first
+
+    def add(self, result: dict, source: dict):
+        """
+        :param result: a search result
+        :param source: where it came from, e.g. {'source': 'PubMed', 'label': ..., 'results_file': ...}
+        :return: None
+        """
+        sources = result.get('sources') or [dict(source, url=result.get('url'),
+                                                  saved_pdf_name=result.get('saved_pdf_name'))]
+
+        group = self.added
+        self.added += 1
+
+        self.groups[group] = [(result, sources)]
+
+        for key in keys_for(result):
+            group = self._union(group, self._keys.setdefault(key, group))
+
+    def add_file(self, path) -> dict:
+        """
+        :param path: a results file written by search.Query (JSON or JSON Lines), or an earlier merged file
+        :return: the file's metadata
+        """
+        metadata = {}
+
+        for result in read_results(path, metadata):
+            self.add(result, {'source': metadata.get('source'), 'label': metadata.get('label'),
+                              'results_file': str(path)})
+
+        return metadata
+
+    def merge_near_duplicates(self) -> int:
+        """
+        Merges groups whose titles and abstracts are near-duplicates, after the exact matching of add.
+
+        :return: the number of groups merged away
+        """
+        index = NearDuplicateIndex()
+        before = len(self.groups)
+
+        for group, records in self.groups.items():
+            result = min((record[0] for record in records), key=rank)
+            abstract = next((result[field] for field in ABSTRACT_FIELDS if result.get(field)), None)
+
+            index.add(group, result.get('title'), abstract)
+
+        for cluster in index.clusters():
+            years, dois = {}, {}
+
+            for group in cluster:
+                years[group] = {year_of(result) for result, _ in self.groups[group]} - {None}
+                dois[group] = {key for result, _ in self.groups[group] for key in keys_for(result)
+                               if key.startswith('doi:')}
+
+            merged = cluster[0]
+
+            for group in cluster[1:]:
+                # A shared title from another year is more likely a different paper, e.g. an annual report
+                if years[merged] and years[group] and not years[merged] & years[group]:
+                    continue
+
+                # Papers with different DOIs are different papers, however alike they read
+                if dois[merged] and dois[group] and not dois[merged] & dois[group]:
+                    continue
+
+                years[merged] |= years[group]
+                dois[merged] |= dois[group]
+                merged = self._union(merged, group)
+
+        return before - len(self.groups)
+
+    def merged(self):
+        """
+        :return: generator of one canonical record per paper, in order of first appearance
+        """
+        for records in self.groups.values():
+            records = sorted(records, key=lambda record: rank(record[0]))
+
+            canonical = dict(records[0][0])
+
+            for result, _ in records[1:]:
+                for field, value in result.items():
+                    if canonical.get(field) in (None, '', [], 'None') and field != 'sources':
+                        canonical[field] = value
+
+            # The same file can be merged twice, e.g. a new engine's results added to an earlier merge
+            sources = {json.dumps(source, sort_keys=True): source for _, sources in records for source in sources}
+            canonical['sources'] = list(sources.values())
+
+            yield canonical
+
+
+def merge_results_files(paths: list, output_file, label: str = None, near_duplicates: bool = True) -> dict:
+    """
+    :param paths: results files of the same topic from different engines (or earlier merges)
+    :param output_file: where to save the merged results. A '.jsonl' file is written as JSON Lines.
+    :param label: label for the merged results. Defaults to the input labels joined with '+'.
+    :param near_duplicates: whether to also merge papers whose titles and abstracts are near-duplicates,
+                            rather than only those matched exactly on DOI, PubMed ID or title and year
+    :return: the merged file's metadata
+    """
+    index = DedupIndex()
+    labels = []
+
+    for path in paths:
+        label_of = index.add_file(path).get('label')
+
+        if label_of and label_of not in labels:
+            labels.append(label_of)
+
+    near = index.merge_near_duplicates() if near_duplicates else 0
+
+    output_file = Path(output_file).expanduser()
+
+    metadata = {'source': MERGED,
+                'label': label or '+'.join(labels) or output_file.stem,
+                'results_files': [str(path) for path in paths],
+                'query_datetime': datetime.datetime.now().strftime("%d-%b-%Y_%H:%M:%S"),
+                'results_in': index.added,
+                'results_out': len(index.groups),
+                'near_duplicates': near}
+
+    print(f"Merged {index.added} results into {len(index.groups)} papers ({near} of the merges by near-duplicate "
+          f"title and abstract). Saving to: {output_file}")
+
+    if is_jsonl(output_file):
+        with ResultsWriter(output_file, metadata) as writer:
+            for result in index.merged():
+                writer.write(result)
+    else:
+        if output_file.parent.parts:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(output_file, 'w') as o:
+            json.dump({'metadata': metadata, 'results': list(index.merged())}, o, indent=5)
+
+    return metadata
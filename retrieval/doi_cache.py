@@ -0,0 +1,106 @@
+"""
+Persistent DOI -> URL cache used by grab.GrabOne.resolve_doi.
+
+Overlapping queries (same topic on another engine, country or disease) keep asking
+dx.doi.org to resolve the same DOIs. Each resolution follows a redirect chain, so the
+final URLs are stored in a small SQLite database that survives between runs. DOIs that
+failed to resolve are cached too, for a shorter time, so they are not retried on every run.
+"""
+import time
+import sqlite3
+import threading
+
+from pathlib import Path
+
+DEFAULT_PATH = '~/.cache/sebi/doi_cache.sqlite'
+
+DAY = 24 * 60 * 60
+
+
+def normalise_doi(doi: str) -> str:
+    """
+    :param doi: a bare DOI, a 'doi:' prefixed one or a dx.doi.org URL
+    :return: the bare, lower-cased DOI (DOIs are case-insensitive)
+    """
+    if 'doi.org/' in doi:
+        doi = doi.split('doi.org/', 1)[1]
+
+    doi = doi.strip().lower()
+
+    if doi.startswith('doi:'):
+        doi = doi[4:].strip()
+
+    return doi
+
+
+class DOICache:
+    def __init__(self, path: str = DEFAULT_PATH, ttl: float = 30 * DAY, negative_ttl: float = DAY):
+        """
+        :param path: location of the SQLite database. Created if it doesn't exist.
+        :param ttl: seconds a resolved URL stays valid
+        :param negative_ttl: seconds a failed resolution is remembered before it is retried
+        """
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS dois ('
+                         'doi TEXT PRIMARY KEY, '
+                         'url TEXT, '
+                         'reason TEXT, '
+                         'expires REAL NOT NULL)')
+        self._db.commit()
+
+    def get(self, doi: str):
+        """
+        :param doi: a bare DOI or a dx.doi.org URL
+        :return: None on a miss, otherwise a (url, reason) tuple. url is None for a cached failure,
+                 in which case reason says why it failed.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT url, reason, expires FROM dois WHERE doi = ?',
+                                   (normalise_doi(doi),)).fetchone()
+
+            if row is None or row[2] < time.time():
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return row[0], row[1]
+
+    def put(self, doi: str, url: str):
+        self._store(doi, url, None, self.ttl)
+
+    def put_failure(self, doi: str, reason: str):
+        self._store(doi, None, reason, self.negative_ttl)
+
+    def _store(self, doi, url, reason, ttl):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO dois (doi, url, reason, expires) VALUES (?, ?, ?, ?)',
+                             (normalise_doi(doi), url, reason, time.time() + ttl))
+            self._db.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute('DELETE FROM dois WHERE expires < ?', (time.time(),))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,197 @@
+"""
+Per-host record, kept between runs, of how often each way of getting a PDF has worked.
+
+Two kinds of strategy are counted for every landing-page host:
+  - the grabber class that handled a result (e.g. 'CitationPDFURL', 'WileyGrabber'), used (with
+    skip_hosts=True) to spot hosts that practically never give us a PDF, so they can be skipped
+    instead of costing a full attempt for every result
+  - the candidate PDF URLs a grabber tries ('candidate:fix_url', 'candidate:citation_pdf_url',
+    'candidate:url'), used to try the one most likely to work on that host first
+
+Counts lose half their weight every HALF_LIFE, so the record follows how a host has done lately: a
+host that failed through an outage is tried again once the outage has faded from its counts.
+
+Counts are loaded once, updated in memory and added to the database when the run closes them, so
+separate runs sharing the file don't overwrite each other's counts. Delete the file, or call
+reset(url) for one host, to forget what has been learnt.
+"""
+import time
+import sqlite3
+import threading
+
+from pathlib import Path
+
+from . import web
+
+DEFAULT_PATH = '~/.cache/sebi/domain_stats.sqlite'
+
+# With skip_hosts, a host is skipped once it has had at least this many recent (decayed) attempts...
+MIN_ATTEMPTS = 10
+# ...and fewer than this fraction of them gave a PDF
+MIN_SUCCESS_RATE = 0.05
+
+# Seconds after which an attempt counts half as much
+HALF_LIFE = 14 * 24 * 60 * 60
+
+# Every this many results for a skipped host, one is tried anyway in case the host has improved
+EXPLORE_EVERY = 20
+
+# Prefix of the candidate URL strategies
+CANDIDATE = 'candidate:'
+
+
+def decay(updated: float, now: float = None) -> float:
+    """
+    :param updated: time.time() when counts were last added to
+    :return: the weight those counts have now
+    """
+    return 0.5 ** (max(0.0, (now or time.time()) - updated) / HALF_LIFE)
+
+
+class DomainStats:
+    def __init__(self, path: str = DEFAULT_PATH, skip_hosts: bool = False):
+        """
+        :param path: location of the SQLite database. Created if it doesn't exist.
+        :param skip_hosts: skip hosts that have recently almost never given a PDF, see should_skip
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.skip_hosts = skip_hosts
+
+        # (host, strategy) -> [attempts, successes], including this run's
+        self.counts = {}
+        # (host, strategy) -> [attempts, successes] from this run only, not yet written
+        self._new = {}
+        # host -> [attempts, successes] over all grabber strategies
+        self._hosts = {}
+        # host -> results skipped this run
+        self._skipped = {}
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS stats ('
+                         'host TEXT NOT NULL, '
+                         'strategy TEXT NOT NULL, '
+                         'attempts REAL NOT NULL, '
+                         'successes REAL NOT NULL, '
+                         'updated REAL, '
+                         'PRIMARY KEY (host, strategy))')
+
+        if 'updated' not in [column[1] for column in self._db.execute('PRAGMA table_info(stats)')]:
+            # Made before counts decayed; they start decaying from now
+            self._db.execute('ALTER TABLE stats ADD COLUMN updated REAL')
+            self._db.execute('UPDATE stats SET updated = ?', (time.time(),))
+
+        self._db.commit()
+
+        now = time.time()
+        for host, strategy, attempts, successes, updated in self._db.execute(
+                'SELECT host, strategy, attempts, successes, updated FROM stats'):
+            weight = decay(updated or now, now)
+            self._add(host, strategy, attempts * weight, successes * weight, self.counts)
+
+    def _add(self, host, strategy, attempts, successes, *counts):
+        for c in counts:
+            a, s = c.get((host, strategy), (0, 0))
+            c[host, strategy] = [a + attempts, s + successes]
+
+        if not strategy.startswith(CANDIDATE) and counts[0] is self.counts:
+            a, s = self._hosts.get(host, (0, 0))
+            self._hosts[host] = [a + attempts, s + successes]
+
+    def record(self, url: str, strategy: str, success: bool):
+        """
+        :param url: landing page URL of the result
+        :param strategy: grabber class name, or CANDIDATE + the kind of candidate URL
+        :param success: whether it produced the PDF
+        """
+        with self._lock:
+            self._add(web.host_of(url), strategy, 1, int(success), self.counts, self._new)
+
+    def success_rate(self, url: str, strategy: str) -> float:
+        """
+        :return: smoothed success rate, 0.5 for a strategy that's never been tried on the host
+        """
+        with self._lock:
+            attempts, successes = self.counts.get((web.host_of(url), strategy), (0, 0))
+
+        return (successes + 1) / (attempts + 2)
+
+    def order(self, url: str, strategies: list) -> list:
+        """
+        :param url: landing page URL of the result
+        :param strategies: strategies in their default order
+        :return: the strategies, most successful on this host first. Ties keep the default order.
+        """
+        return sorted(strategies, key=lambda strategy: -self.success_rate(url, strategy))
+
+    def should_skip(self, url: str) -> bool:
+        """
+        :param url: landing page URL of a result about to be grabbed
+        :return: True if skip_hosts is set and the host has hardly ever given us a PDF lately. Every
+                 EXPLORE_EVERY-th call for such a host returns False, so it still gets the odd try.
+        """
+        if not self.skip_hosts:
+            return False
+
+        host = web.host_of(url)
+
+        with self._lock:
+            attempts, successes = self._hosts.get(host, (0, 0))
+
+            if attempts < MIN_ATTEMPTS or successes / attempts >= MIN_SUCCESS_RATE:
+                return False
+
+            self._skipped[host] = self._skipped.get(host, 0) + 1
+
+            return self._skipped[host] % EXPLORE_EVERY != 0
+
+    def reset(self, url: str = None):
+        """
+        :param url: any URL on the host to forget, e.g. after a long outage. None forgets every host.
+        """
+        host = web.host_of(url) if url is not None else None
+
+        with self._lock:
+            for c in (self.counts, self._new):
+                for key in [key for key in c if host is None or key[0] == host]:
+                    del c[key]
+
+            for c in (self._hosts, self._skipped):
+                for key in [key for key in c if host is None or key == host]:
+                    del c[key]
+
+            if host is None:
+                self._db.execute('DELETE FROM stats')
+            else:
+                self._db.execute('DELETE FROM stats WHERE host = ?', (host,))
+            self._db.commit()
+
+    def flush(self):
+        now = time.time()
+
+        with self._lock:
+            # Read, decay and write back in one transaction, so runs flushing at the same time don't lose counts
+            self._db.execute('BEGIN IMMEDIATE')
+
+            rows = []
+            for (host, strategy), (a, s) in self._new.items():
+                old = self._db.execute('SELECT attempts, successes, updated FROM stats WHERE host = ? AND strategy = ?',
+                                       (host, strategy)).fetchone()
+                old_a, old_s, updated = old or (0, 0, now)
+                weight = decay(updated or now, now)
+
+                rows.append((host, strategy, old_a * weight + a, old_s * weight + s, now))
+
+            self._db.executemany('INSERT OR REPLACE INTO stats (host, strategy, attempts, successes, updated) '
+                                 'VALUES (?, ?, ?, ?, ?)', rows)
+            self._db.commit()
+            self._new = {}
+
+    def close(self):
+        self.flush()
+
+        with self._lock:
+            self._db.close()
@@ -1,55 +1,479 @@
 import os
 import re
 import json
+import time
 import tqdm
+import hashlib
+import tempfile
+import importlib
+import threading
 import requests
 
+from . import web
+from .doi_cache import DOICache
+from .domain_stats import DomainStats, CANDIDATE
+from .screen import Screener
+from .manifest import Manifest, COMPLETE, PARTIAL, FAILED, DEFERRED
+from .store import PDFStore, keys_for
+from .ledger import FailureLedger, Replay, code_for
+from .ledger import NO_URL, DOI_UNRESOLVED, HTTP_STATUS, NOT_PDF, TOO_LARGE, TIMEOUT, HOST_UNAVAILABLE, NO_PDF
+from .ledger import WRITE_ERROR, LOW_SUCCESS, SCREENED_OUT, ERROR
+from .telemetry import Telemetry, RESOLVE, LANDING, PDF, OK
+from .results import SavedResults
+
 from pathlib import Path
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# PDFs larger than this (in bytes) are abandoned part way through the download
+MAX_PDF_SIZE = 100 * 1024 * 1024
+
+# Bytes read from the network and written to disk at a time when saving a PDF
+CHUNK_SIZE = 64 * 1024
+
+# A partial download '<filename>.part' is kept with '<filename>.part.json', saying which URL it came from
+# and the ETag or Last-Modified of the PDF, so it is only continued from that URL and only if the PDF is unchanged
+PART_INFO_SUFFIX = '.json'
+
+# Seconds to wait for a candidate PDF URL to come good before also trying the next one
+HEDGE_DELAY = 3.0
 
+# Seconds one result may spend resolving, finding and downloading its PDF. None for no limit.
+ITEM_DEADLINE = 120.0
 
-def download(searcher, output_folder):
+# Results waiting for a download worker in pipelined mode, beyond one per worker. When the queue is
+# full the search stops paging until downloads catch up.
+QUEUE_SIZE = 50
+
+# Landing pages are read this many bytes at a time until </head> turns up...
+HEAD_CHUNK_SIZE = 16 * 1024
+# ...and the citation meta tags are looked for in at most this many bytes
+MAX_HEAD_SIZE = 256 * 1024
+
+
+def download(searcher, output_folder, workers: int = 1, per_host: int = 2, doi_cache: str = None,
+             max_pdf_size: int = MAX_PDF_SIZE, resume: bool = True, pdf_store: str = None, host_rate: float = None,
+             pipeline: bool = False, queue_size: int = QUEUE_SIZE, item_deadline: float = ITEM_DEADLINE,
+             domain_stats: str = None, skip_hosts: bool = False, screen_model: str = None,
+             screen_threshold: float = 0.0):
     """
-    :param searcher: a search.Query object which has had its .run() method called.
+    :param searcher: a search.Query object which has had its .run() method called, or with pipeline=True,
+                     one which hasn't. A run Query with a JSON Lines results file has its results read back
+                     from the file one at a time.
     :param output_folder: location to save the PDFs to
+    :param workers: number of results to download at the same time. 1 downloads serially.
+    :param per_host: maximum number of simultaneous requests to any one host
+    :param doi_cache: path to a SQLite DOI -> URL cache shared between runs. None disables caching.
+    :param max_pdf_size: largest PDF, in bytes, that will be downloaded. None for no limit.
+    :param resume: skip results whose PDF the folder's manifest says is already downloaded
+    :param pdf_store: folder of a PDFStore shared between folders and runs. None saves PDFs directly.
+    :param host_rate: requests per second each host is allowed to begin with. Adapts as hosts answer.
+    :param pipeline: run the search here and start downloading each result as soon as the search returns it,
+                     rather than waiting for every page. The search results JSON is saved once the search ends.
+    :param queue_size: with pipeline=True, how many results may wait for a download worker before the
+                       search is paused
+    :param item_deadline: seconds each result may take before it is given up on. None for no limit.
+    :param domain_stats: path to a SQLite record of which grabbers and PDF URLs have worked on each host,
+                         shared between runs. Used to try the likeliest PDF URL first. None disables it.
+    :param skip_hosts: with domain_stats, skip results on hosts that have recently almost never given a PDF
+    :param screen_model: a pickled classifier (see screen.py) to score each result's title and abstract with
+                         before downloading it. None downloads every result.
+    :param screen_threshold: with screen_model, only results whose decision function is at least this are
+                             downloaded, most confident first
+    :return: None
+
+    Wrapper for grab.GrabAll class, which itself just calls grab.GrabOne for every result.
+    """
+    if not pipeline and getattr(searcher, 'streaming', False):
+        # A JSON Lines search keeps no results in memory, so they're read back from its file as they're downloaded
+        searcher = SavedResults(searcher.results_file)
+        pipeline = True
+
+    if pipeline or searcher.data['results']:
+        cache = DOICache(doi_cache) if doi_cache else None
+        store = PDFStore(pdf_store) if pdf_store else None
+        stats = DomainStats(domain_stats, skip_hosts=skip_hosts) if domain_stats else None
+        screener = Screener(screen_model, screen_threshold) if screen_model else None
+
+        g = GrabAll(searcher, output_folder, workers=workers, per_host=per_host, doi_cache=cache,
+                    max_pdf_size=max_pdf_size, resume=resume, store=store, host_rate=host_rate,
+                    queue_size=queue_size, item_deadline=item_deadline, domain_stats=stats, screener=screener)
+        g.run(searcher.iter_results() if pipeline else None)
+
+        if store is not None:
+            store.close()
+
+        if stats is not None:
+            stats.close()
+
+        if g.skipped:
+            print(f"Skipped {g.skipped} results already downloaded in {g.output_folder}")
+
+        print(f"Download metrics saved to: {g.telemetry_path}.json / .prom")
+
+        if screener is not None:
+            print(f"Screening kept {screener.kept} results and screened out {screener.rejected} "
+                  f"(threshold {screener.threshold})")
+
+        failures = {code: n for code, n in g.ledger.counts.items() if code != SCREENED_OUT}
+
+        if failures:
+            counts = ', '.join(f'{code}: {n}' for code, n in sorted(failures.items()))
+            print(f"{sum(failures.values())} failures ({counts}). Saved to: {g.ledger.path}")
+
+        if cache is not None:
+            print(f"DOI cache: {cache.hits} hits, {cache.misses} misses")
+            cache.close()
+
+
+def retry(ledger_path, output_folder, codes=None, **kwargs):
+    """
+    :param ledger_path: a failures_<label>.jsonl file written by an earlier run
+    :param output_folder: location to save the PDFs to, normally the folder of the earlier run
+    :param codes: only retry failures with one of these reason codes (see ledger.py). None retries all of them.
+    :param kwargs: passed on to download, e.g. workers, per_host, doi_cache
     :return: None
 
-    Wrapper for grab.GrabAll class, which itself just iteratively calls grab.GrabOne.
+    Sends the failed results back through the downloader without repeating the search. Results
+    that have been downloaded since they failed are skipped unless resume=False.
     """
-    if searcher.data['results']:
-        g = GrabAll(searcher, output_folder)
-        g.run()
+    download(Replay(ledger_path, codes), output_folder, **kwargs)
 
 
 class GrabAll:
-    def __init__(self, searcher, output_folder):
+    def __init__(self, searcher, output_folder, workers: int = 1, per_host: int = 2, doi_cache: DOICache = None,
+                 max_pdf_size: int = MAX_PDF_SIZE, resume: bool = True, store: PDFStore = None,
+                 host_rate: float = None, queue_size: int = QUEUE_SIZE, item_deadline: float = ITEM_DEADLINE,
+                 domain_stats: DomainStats = None, screener: Screener = None):
         self.searcher = searcher
 
         self.output_folder = Path(output_folder).expanduser()
 
-    def run(self):
+        self.workers = max(1, workers)
 
-        main_bar = tqdm.tqdm(total=len(self.searcher.data['results']), desc='')
+        self.queue_size = queue_size
+
+        self.item_deadline = item_deadline
+
+        self.doi_cache = doi_cache
+
+        self.domain_stats = domain_stats
+
+        self.screener = screener
+
+        self.max_pdf_size = max_pdf_size
+
+        self.store = store
+
+        self.resume = resume
+        self.skipped = 0
+        self.deferred = 0
+        self._skipped_lock = threading.Lock()
+
+        self.manifest = None
+        self.ledger = FailureLedger(self.output_folder, self.searcher.label)
+        self.telemetry = Telemetry()
+        self.telemetry_path = f'{self.output_folder}/logs/telemetry_{self.searcher.label}'
+
+        web.configure(per_host=per_host, rate=host_rate)
+
+    def grab(self, result):
+        filename = result['saved_pdf_name']
+
+        with self.manifest.name_lock(filename):
+            if self.resume and self.manifest.is_complete(filename):
+                with self._skipped_lock:
+                    self.skipped += 1
+                return
 
-        for result in self.searcher.data['results']:
-            
             g = GrabOne(save_location=self.output_folder,
                         bib_info=result,
                         label=self.searcher.label,
-                        url=result['url'])
+                        url=result['url'],
+                        doi_cache=self.doi_cache,
+                        max_pdf_size=self.max_pdf_size,
+                        manifest=self.manifest,
+                        ledger=self.ledger,
+                        store=self.store,
+                        telemetry=self.telemetry,
+                        deadline=self.item_deadline,
+                        domain_stats=self.domain_stats)
+
+            g.run(filename=filename)
+
+            if g.is_deferred():
+                with self._skipped_lock:
+                    self.deferred += 1
+
+    def run(self, results=None):
+        """
+        :param results: results to download. Defaults to the searcher's results; can also be an iterator
+                        that produces them while they are being downloaded, e.g. searcher.iter_results().
+        :return: None
+        """
+        self.manifest = Manifest(self.output_folder)
+
+        if results is None:
+            results = self.searcher.data['results']
+
+        if self.screener is not None:
+            if isinstance(results, list):
+                results = self.screener.screen(results, rejected=self.screened_out)
+            else:
+                results = self.screener.screen_iter(results, rejected=self.screened_out)
 
-            main_bar.set_description_str(f"File: {result['saved_pdf_name']}")
+        try:
+            if isinstance(results, list):
+                self._run(results)
+            else:
+                self._run_pipelined(results)
+        finally:
+            self.manifest.close()
+            self.ledger.close()
+            self.telemetry.save(self.telemetry_path)
+
+            if self.deferred:
+                print(f"{self.deferred} results were skipped because their host was unavailable. "
+                      f"Retry them later with grab.retry('{self.ledger.path}', '{self.output_folder}', "
+                      f"codes=['{HOST_UNAVAILABLE}'])")
+
+    def screened_out(self, result: dict, score: float):
+        self.ledger.record(result['saved_pdf_name'], SCREENED_OUT,
+                           f'Screening score {score:.3f} is below the threshold {self.screener.threshold}', result)
+
+    def _run(self, results):
+
+        main_bar = tqdm.tqdm(total=len(results), desc='')
+
+        if self.workers == 1:
+            for result in results:
+                main_bar.set_description_str(f"File: {result['saved_pdf_name']}")
+
+                try:
+                    self.grab(result)
+                except Exception as e:
+                    # One bad result should not take down the rest of the batch
+                    main_bar.write(f"Error grabbing {result['url']}: {e}")
+
+                main_bar.set_postfix(self.telemetry.postfix(), refresh=False)
+                main_bar.update(1)
+
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.grab, result): result for result in results}
+
+            for future in as_completed(futures):
+                result = futures[future]
+
+                main_bar.set_description_str(f"File: {result['saved_pdf_name']}")
 
-            g.run(filename=result['saved_pdf_name'])
+                try:
+                    future.result()
+                except Exception as e:
+                    # One bad result should not take down the rest of the batch
+                    main_bar.write(f"Error grabbing {result['url']}: {e}")
 
+                main_bar.set_postfix(self.telemetry.postfix(), refresh=False)
+                main_bar.update(1)
+
+    def _run_pipelined(self, results):
+        """
+        :param results: iterator of results, usually still being produced by a search
+
+        Hands each result to the download workers as soon as the iterator yields it. At most
+        workers + queue_size results are in flight at once; beyond that the iterator isn't
+        advanced, which holds the search back until downloads catch up.
+        """
+        main_bar = tqdm.tqdm(total=0, desc='')
+        slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+        def grab(result):
+            try:
+                self.grab(result)
+            except Exception as e:
+                # One bad result should not take down the rest of the batch
+                main_bar.write(f"Error grabbing {result['url']}: {e}")
+            finally:
+                slots.release()
+
+            main_bar.set_description_str(f"File: {result['saved_pdf_name']}")
+            main_bar.set_postfix(self.telemetry.postfix(), refresh=False)
             main_bar.update(1)
 
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for result in results:
+                slots.acquire()
+
+                main_bar.total += 1
+                main_bar.refresh()
+
+                pool.submit(grab, result)
+
+
+class HeadParser(HTMLParser):
+    """
+    Collects the <meta name="citation_..." content="..."> tags (citation_pdf_url, citation_doi,
+    citation_title, ...) from an HTML page's <head>, ignoring everything after it.
+    """
+    def __init__(self):
+        super().__init__()
+        self.meta = {}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.done = True
+
+        if self.done or tag != 'meta':
+            return
+
+        attrs = dict(attrs)
+        name = (attrs.get('name') or '').lower()
+
+        # Pages sometimes repeat a tag (e.g. several authors); the first one wins
+        if name.startswith('citation_') and attrs.get('content') and name not in self.meta:
+            self.meta[name] = attrs['content'].strip()
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+
+class LandingPage:
+    """
+    A fetched landing page, kept by GrabOne and handed to the chosen grabber so that
+    the same URL is never downloaded or parsed twice for one result.
+
+    For an HTML page only the <head> is read at first and its citation meta tags are put in
+    .meta, which is usually all that's needed to find the PDF. The rest of the body is only
+    downloaded when .content is used, and only parsed with BeautifulSoup when .html is.
+
+    The response may be streamed. A PDF body is left unread so the grabber can stream it to disk;
+    call close() if the page ends up not being used.
+    """
+    def __init__(self, url: str, response):
+        self.url = url
+        self.response = response
+        self.head = b''
+        self.meta = {}
+        self._chunks = None
+        self._content = None
+        self._html = None
+        self._closed = False
+
+        if not self.is_pdf:
+            self._read_head()
+
+    def _read_head(self):
+        self._chunks = self.response.iter_content(HEAD_CHUNK_SIZE)
+
+        for chunk in self._chunks:
+            self.head += chunk
+
+            if b'</head' in self.head[-len(chunk) - 6:].lower() or len(self.head) >= MAX_HEAD_SIZE:
+                break
+        else:
+            # The whole page fitted in the head
+            self._content = self.head
+            self.response.close()
+
+        try:
+            text = self.head.decode(self.response.encoding or 'utf-8', errors='replace')
+        except LookupError:
+            text = self.head.decode('utf-8', errors='replace')
+
+        parser = HeadParser()
+        parser.feed(text)
+        self.meta = parser.meta
+
+    @property
+    def is_pdf(self) -> bool:
+        return 'pdf' in self.response.headers.get('content-type', '').lower()
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            if self._closed:
+                # The rest of the body was dropped by close(), so the page has to be fetched again
+                self._content = web.get(self.url).content
+            elif self._chunks is not None:
+                try:
+                    self._content = self.head + b''.join(self._chunks)
+                finally:
+                    self.response.close()
+            else:
+                self._content = self.response.content
+                self.response.close()
+
+        return self._content
+
+    @property
+    def bytes_read(self) -> int:
+        """
+        :return: bytes of an HTML page downloaded so far. A PDF body is counted by the grabber that saves it.
+        """
+        if self.is_pdf:
+            return 0
+
+        return len(self._content if self._content is not None else self.head)
+
+    def read_body(self):
+        """
+        Finishes downloading the page, so that its connection and host slot are given back.
+        """
+        return self.content
+
+    def close(self):
+        if self._content is None:
+            self._closed = True
+
+        self.response.close()
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._html = BeautifulSoup(self.content, 'lxml')
+
+        return self._html
+
 
 class GrabOne:
-    def __init__(self, save_location, bib_info: dict, label: str, url: str):
+    def __init__(self, save_location, bib_info: dict, label: str, url: str, doi_cache: DOICache = None,
+                 max_pdf_size: int = MAX_PDF_SIZE, manifest: Manifest = None, ledger: FailureLedger = None,
+                 store: PDFStore = None, telemetry: Telemetry = None, deadline: float = ITEM_DEADLINE,
+                 domain_stats: DomainStats = None):
         self.save_location = Path(save_location).expanduser()
         self.label = label
         self.bib_info = bib_info
+        self.doi_cache = doi_cache
+        self.max_pdf_size = max_pdf_size
+        self.manifest = manifest
+        self.ledger = ledger
+        self.store = store
+        self.telemetry = telemetry or Telemetry()
+        self.domain_stats = domain_stats
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.landing = None
+
+        # (code, reason, url, status) of the first thing that went wrong, see log
+        self.failure = None
+
+        stored = store.lookup(keys_for(url)) if store is not None else None
+
+        if stored is not None:
+            # Already downloaded for another label, query or folder, so there is nothing to resolve or fetch
+            self.url = url
+            self.grabber = StoredPDF(save_location=self.save_location,
+                                     bib_info=self.bib_info,
+                                     label=self.label,
+                                     url=url,
+                                     store=store,
+                                     sha256=stored,
+                                     telemetry=self.telemetry)
+            return
 
         if 'dx.doi.org/' in url:
             # Do the DOI redirect here to get the actual URL before choosing a Grabber
@@ -61,196 +485,752 @@ class GrabOne:
 
 
     def resolve_doi(self, doi):
-            user_agent = 'Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like ' \
-                         'Firefox/3.5.5; Debian-3.5.5-1) '
-            headers = {'User-Agent': user_agent}
-
             if doi == 'http://dx.doi.org/None':
-                self.log(reason=f'No DOI or URL was available for this item')
+                self.log(reason=f'No DOI or URL was available for this item', code=NO_URL)
                 return "http://none"
 
+            if self.doi_cache is not None:
+                cached = self.doi_cache.get(doi)
+
+                if cached is not None:
+                    url, reason = cached
+
+                    if url is None:
+                        self.log(reason=f'{reason} (cached)', code=DOI_UNRESOLVED, url=doi)
+                        return "http://none"
+
+                    return url
+
             try:
-                r = requests.get(doi, headers=headers, allow_redirects=True, timeout=(10,10))
+                with self.telemetry.timer(RESOLVE, doi):
+                    r = web.get(doi, allow_redirects=True, stream=True, deadline=self.deadline)
             except Exception as e:
-                self.log(reason=f'Exception raised for DOI {doi} : {e}')
+                # Timeouts and connection errors are usually transient, so they are not cached
+                self.log(reason=f'Exception raised for DOI {doi} : {e}', code=code_for(e), url=doi)
                 return "http://none"
 
             if r.status_code != 200:
-                self.log(reason=f'HTTP Error for DOI {doi} : {r.status_code}')
+                r.close()
+
+                reason = f'HTTP Error for DOI {doi} : {r.status_code}'
+
+                if self.doi_cache is not None and r.status_code < 500 and r.status_code != 429:
+                    self.doi_cache.put_failure(doi, reason)
+
+                self.log(reason=reason, code=DOI_UNRESOLVED, url=doi, status=r.status_code)
                 return "http://none"
 
-            if 'elsevier.com/' in r.url:
-                target = r.url.split('/')[-1]
-                return f"https://www.sciencedirect.com/science/article/pii/{target}"
+            url = r.url
 
-            return r.url
+            try:
+                # Following the redirect already downloaded the landing page, so keep it for choose_grabber
+                self.landing = LandingPage(url, r)
+            except Exception as e:
+                # The page's head was cut off part way, e.g. a read timeout or a reset connection
+                r.close()
+                self.log(reason=f'Could not read landing page for DOI {doi}. Error: {e}', code=code_for(e), url=url)
+                return "http://none"
+
+            if 'elsevier.com/' in url:
+                target = url.split('/')[-1]
+                url = f"https://www.sciencedirect.com/science/article/pii/{target}"
+
+                self.landing.close()
+                self.landing = None
+
+            if self.doi_cache is not None:
+                self.doi_cache.put(doi, url)
+
+            return url
+
+    def get_failure(self):
+        """
+        :return: (code, reason, url, status) of the first failure while resolving or downloading, or None
+        """
+        return self.failure or getattr(getattr(self, 'grabber', None), 'failure', None)
+
+    def is_deferred(self) -> bool:
+        """
+        :return: True if this result wasn't attempted properly because a host's circuit breaker was open
+        """
+        failure = self.get_failure()
 
-    def log(self, reason=None):
-        os.makedirs(f'{self.save_location}/logs', exist_ok=True)
+        return failure is not None and failure[0] == HOST_UNAVAILABLE
 
-        self.bib_info['DOI_fail_reason'] = reason
+    def record(self, filename: str, saved: bool):
+        """
+        :param filename: the result's saved_pdf_name
+        :param saved: whether the PDF was written
+        :return: None
 
-        with open(f'{self.save_location}/logs/failed_to_resolve_DOI_{self.label}.txt', 'a') as out:
-            out.write('\n')
-            json.dump(self.bib_info, out)
-            out.write(f'\n')
-            out.write('='*70)
+        Notes the outcome in the manifest and, for a failure, in the failure ledger.
+        """
+        code = None
+
+        if saved:
+            self.telemetry.outcome(type(self.grabber).__name__, self.url, OK)
+        else:
+            code, reason, url, status = self.get_failure() or (ERROR, 'Unknown error', None, None)
+
+            self.telemetry.outcome(type(getattr(self, 'grabber', None)).__name__, self.url, code)
+
+            if self.ledger is not None:
+                self.ledger.record(filename, code, reason, self.bib_info, url=url, status=status)
+
+        # Only real attempts count towards the host's record: not results that never reached it, were
+        # already in the store, or failed for reasons that say nothing about the host
+        if (self.domain_stats is not None and not isinstance(getattr(self, 'grabber', None), (NoURL, StoredPDF))
+                and code not in (HOST_UNAVAILABLE, LOW_SUCCESS, WRITE_ERROR)):
+            self.domain_stats.record(self.url, type(self.grabber).__name__, saved)
+
+        if self.manifest is None:
+            return
+
+        if saved:
+            status = COMPLETE
+        elif self.is_deferred():
+            status = DEFERRED
+        elif os.path.exists(f'{self.save_location}/{filename}.part'):
+            status = PARTIAL
+        else:
+            status = FAILED
+
+        self.manifest.record(filename, status,
+                             url=self.bib_info.get('url'),
+                             final_url=self.grabber.pdf_url,
+                             size=self.grabber.pdf_size,
+                             sha256=self.grabber.pdf_sha256)
+
+    def log(self, reason=None, code=ERROR, url=None, status=None):
+        """
+        :param reason: human-readable description of what went wrong
+        :param code: reason code from ledger.py
+        :param url: URL being fetched when it went wrong
+        :param status: HTTP status code, for HTTP errors
+        :return: None
+
+        Only the first failure is kept, since later ones are usually a consequence of it. It is written
+        to the failure ledger by record.
+        """
+        if self.failure is None:
+            self.failure = (code, reason, url, status)
 
     def choose_grabber(self):
         args = dict(save_location=self.save_location,
                     bib_info=self.bib_info,
                     label=self.label,
-                    url=self.url)
+                    url=self.url,
+                    max_pdf_size=self.max_pdf_size,
+                    store=self.store,
+                    telemetry=self.telemetry,
+                    deadline=self.deadline,
+                    domain_stats=self.domain_stats)
 
         if self.url.lower() == "http://none":
             return NoURL(**args)
 
-        try:
-            data = requests.get(self.url, timeout=(10,10))
-        except:
+        if self.domain_stats is not None and self.domain_stats.should_skip(self.url):
+            self.log(reason=f'Skipped: PDFs have almost never been downloaded from {web.host_of(self.url)}',
+                     code=LOW_SUCCESS, url=self.url)
             return NoURL(**args)
 
-        html = BeautifulSoup(data.content, 'lxml')
-        meta = html.find('meta', attrs={"name":'citation_pdf_url'})
+        if self.landing is None:
+            r = None
+
+            try:
+                with self.telemetry.timer(LANDING, self.url):
+                    r = web.get(self.url, stream=True, deadline=self.deadline)
+                    self.landing = LandingPage(self.url, r)
+            except Exception as e:
+                # A streamed response that failed while its head was being read still holds a host slot
+                if r is not None:
+                    r.close()
+
+                self.log(reason=f'Could not fetch landing page. Error: {e}', code=code_for(e), url=self.url)
+                return NoURL(**args)
+
+        args['landing'] = self.landing
+
+        if self.landing.is_pdf:
+            # The URL already points straight at the PDF, so there is no page to parse
+            return BaseGrabber(**args)
 
-        if meta:
-            args['url'] = meta.attrs['content']
+        pdf_url = self.landing.meta.get('citation_pdf_url')
+
+        if pdf_url:
+            # That's all that was needed from the page, so the rest of it isn't downloaded
+            self.landing.close()
+
+            args['url'] = pdf_url
             return CitationPDFURL(**args)
 
-        if "biomedcentral.com/" in self.url:
-            return BiomedcentralGrabber(**args)
-        if "springer.com/" in self.url:
-            return SpringerGrabber(**args)
-        if "sciencedirect.com/" in self.url:
-            return ScienceDirectGrabber(**args)
-        if "academia.edu/" in self.url:
-            return AcademiaEduGrabber(**args)
-        if "wiley.com/" in self.url:
-            return WileyGrabber(**args)
-        if "ncbi.nlm.nih.gov/" in self.url:
-            return NIHGrabber(**args)
-        if 'scielo.org.za/' in self.url:
-            return ScieloGrabber(**args)
-        if 'journals.plos.org/' in self.url:
-            return PlosGrabber(**args)
-        if 'ojvr.org/' in self.url:
-            return OJVRGrabber(**args)
-        if 'cambridge.org/' in self.url:
-            return CambridgeGrabber(**args)
-        if 'veterinaryworld.org/' in self.url:
-            return VetWorldGrabber(**args)
-        if 'hindawi.com/' in self.url:
-            return HindawiGrabber(**args)
-        if 'ejmanager' in self.url:
-            return EJManagerGrabber(**args)
-        if 'scialert.net/' in self.url:
-            return SciAlertGrabber(**args)
-        if 'medwelljournals.' in self.url:
-            return MedwellGrabber(**args)
-        if 'jidc.org/' in self.url:
-            return JIDCGrabber(**args)
-        if 'oup.com/' in self.url:
-            return OUPGrabber(**args)
-        if 'aem.asm.org/' in self.url:
-            return ASMAEMGrabber(**args)
-        if 'frontiersin.org/' in self.url:
-            return FrontiersGrabber(**args)
-        if 'indianjournals.com/' in self.url:
-            return IndianJournalsGrabber(**args)
-        if 'springeropen.com/' in self.url:
-            return SpringerOpenGrabber(**args)
-        if 'tandfonline.com/' in self.url:
-            return TandFGrabber(**args)
-        if 'ijpsr.com/' in self.url:
-            return IJPSRGrabber(**args)
-        if 'liebertpub.com/' in self.url:
-            return LiebertGrabber(**args)
-        if 'ajtmh.org/' in self.url:
-            return AJTMHGrabber(**args)
-        if 'panafrican-med-journal' in self.url:
-            return PanAfricanGrabber(**args)
-        if 'sagepub.com/' in self.url:
-            return SagePubGrabber(**args)
-        if 'akademia.com/' in self.url:
-            return AkademiaiGrabber(**args)
-        if 'ajol.info/' in self.url:
-            return AJOLGrabber(**args)
-        if 'jfoodprotection.org/' in self.url:
-            return JFoodGrabber(**args)
-        if 'jsava.co.za/' in self.url:
-            return JsavaGrabber(**args)
-        if 'bioone.org/' in self.url:
-            return BiooneGrabber(**args)
-        if 'humankinetics.com/' in self.url:
-            return HumanKineticsGrabber(**args)
-        if 'cdc.gov/' in self.url:
-            return CDCGrabber(**args)
-        if 'ekb.eg/' in self.url:
-            return EKBGrabber(**args)
-        if 'microbiologyresearch.org/' in self.url:
-            return MicroBioResearch(**args)
-
-        return BaseGrabber(**args)
+        grabber = GRABBERS.lookup(self.url) or BaseGrabber
+
+        if not grabber.needs_body:
+            # The grabber only rewrites the URL, so the rest of the page is never downloaded
+            self.landing.close()
+            return grabber(**args)
+
+        # The grabber looks at the rest of the page. Reading it now rather than while it makes
+        # its own requests means the host slot it holds is free for those.
+        try:
+            self.landing.read_body()
+        except Exception as e:
+            self.log(reason=f'Could not read landing page. Error: {e}', code=code_for(e), url=self.url)
+            return NoURL(**args)
+
+        return grabber(**args)
 
     def run(self, filename):
-        if hasattr(self, 'grabber'):
+        saved = False
 
-            if self.url == 'http://none':
-                self.grabber.log(reason=f'Could not resolve DOI to URL. Error: {self.grabber.error}')
-            else:
+        try:
+            if hasattr(self, 'grabber'):
+
+                if isinstance(self.grabber, NoURL):
+                    # Either the DOI couldn't be resolved or the landing page couldn't be fetched (which is
+                    # already logged), and trying the same unreachable URL again would only wait out another timeout
+                    if self.get_failure() is None:
+                        self.log(reason='No DOI or URL was available for this item', code=NO_URL)
+                else:
+
+                    pdf_path = self.grabber.get_pdf(filename)
+
+                    saved = self.grabber.write_pdf(pdf_path, filename)
+                    self.grabber.write_json(self.grabber.bib_info, filename)
+
+            self.record(filename, saved)
+        finally:
+            # An unused streamed landing page still holds its connection and host slot
+            if self.landing is not None:
+                self.landing.close()
+
+            for landing in {self.landing, getattr(getattr(self, 'grabber', None), 'landing', None)} - {None}:
+                self.telemetry.add_bytes(landing.url, landing.bytes_read)
+
+
+class GrabberRegistry:
+    """
+    Maps publisher domains to the grabber class that handles them.
+
+    A lookup walks the dot-separated suffixes of the URL's hostname, most specific first
+    (www.tandfonline.com, tandfonline.com, com), so choosing a grabber is a handful of dict
+    lookups however many publishers are registered.
+    """
+    def __init__(self):
+        self._by_domain = {}
+
+    def register(self, grabber):
+        """
+        Adds a grabber for every domain in its `domains` attribute. Usable as a class decorator.
+
+        :param grabber: a BaseGrabber subclass
+        :return: the grabber
+        """
+        for domain in grabber.domains:
+            self._by_domain[domain.lower()] = grabber
+
+        return grabber
+
+    def lookup(self, url: str):
+        """
+        :param url: landing page URL
+        :return: the grabber class registered for the URL's host, or None
+        """
+        labels = web.host_of(url).split('.')
+
+        for i in range(len(labels)):
+            grabber = self._by_domain.get('.'.join(labels[i:]))
 
-                pdf_data = self.grabber.get_pdf()
+            if grabber is not None:
+                return grabber
 
-                self.grabber.write_pdf(pdf_data, filename)
-                self.grabber.write_json(self.grabber.bib_info, filename)
+        return None
+
+
+GRABBERS = GrabberRegistry()
+
+# Third-party grabbers register themselves the same way as the ones below, e.g.
+#
+#   @register_grabber
+#   class MyPublisherGrabber(BaseGrabber):
+#       domains = ('mypublisher.org',)
+#
+# and are picked up once their module is imported, see load_grabber_plugins.
+register_grabber = GRABBERS.register
+
+
+def load_grabber_plugins(modules):
+    """
+    :param modules: importable module names that define and register extra grabbers
+    :return: None
+    """
+    for module in modules:
+        importlib.import_module(module)
 
 
 class BaseGrabber:
     """
     Many sites won't allow access without a properly specified User-Agent in the header
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
+    domains = ()
+
+    # Extra request headers sent when fetching the PDF
+    headers = {}
+
+    # Whether fix_url reads the landing page body. When it doesn't, GrabOne drops the page after its head.
+    needs_body = False
+
+    def __init__(self, save_location: str, bib_info: dict, label: str, url: str, landing: LandingPage = None,
+                 max_pdf_size: int = MAX_PDF_SIZE, store: PDFStore = None, telemetry: Telemetry = None,
+                 deadline: float = None, domain_stats: DomainStats = None):
         self.save_location = save_location
         self.bib_info = bib_info
         self.label = label
         self.url = url
         self.error = 'None'
         self.original_url = url
+        self.landing = landing
+        self.max_pdf_size = max_pdf_size
+        self.store = store
+        self.telemetry = telemetry or Telemetry()
+        self.domain_stats = domain_stats
+
+        # time.monotonic() by which the PDF must be saved, or None for no limit
+        self.deadline = deadline
+
+        # candidate PDF URL -> which kind of candidate it is, see candidate_urls
+        self.candidates = {}
+
+        # (code, reason, url, status) of the first thing that went wrong, see log
+        self.failure = None
+
+        # Set once a PDF has been downloaded
+        self.pdf_url = None
+        self.pdf_size = None
+        self.pdf_sha256 = None
 
         os.makedirs(save_location, exist_ok=True)
 
-    def get_pdf(self):
-        url = self.fix_url()
+    def get_landing(self) -> LandingPage:
+        """
+        :return: the LandingPage for self.url, reusing the one GrabOne already fetched where possible
+        """
+        if self.landing is None or self.landing.url != self.url:
+            with self.telemetry.timer(LANDING, self.url):
+                self.landing = LandingPage(self.url, web.get(self.url, deadline=self.deadline))
+
+        return self.landing
+
+    def get_pdf(self, filename: str = None):
+        """
+        :param filename: name the PDF will be saved under. The download goes to '<filename>.part' so that
+                         an interrupted one can be resumed. Without it a random temporary name is used.
+        :return: path to the file in save_location holding the PDF, or None if it couldn't be fetched.
+
+        The PDF is streamed to disk in CHUNK_SIZE pieces, so memory use doesn't grow with the file size.
+        When there is more than one candidate URL they are raced, see race.
+        """
+        try:
+            urls = self.candidate_urls()
+        except Exception as e:
+            code = code_for(e)
+            self.log(reason=f'Could not find PDF URL. Exception: {e}', code=NO_PDF if code == ERROR else code,
+                     url=self.url)
+            return None
+
+        part_path = f'{self.save_location}/{filename}.part' if filename else None
+        source = self.partial_source(part_path)
+
+        if source is None or source.get('url') not in urls:
+            # A partial download can only be continued from the URL it came from, so one from elsewhere
+            # (or from an unknown URL) is started again
+            self.remove_partial(part_path)
+            source = None
+
+        with self.telemetry.timer(PDF, urls[0]):
+            if source is not None or len(urls) == 1:
+                url = source['url'] if source is not None else urls[0]
+                path = self.fetch_pdf(url, filename, source)
+
+                self.record_candidates({url: path is not None})
+
+                return path
+
+            return self.race(urls, part_path)
+
+    @staticmethod
+    def partial_source(part_path: str = None):
+        """
+        :param part_path: a partial download, see get_pdf
+        :return: {'url': ..., 'etag': ..., 'last_modified': ...} for the partial download, or None if there
+                 isn't one or where it came from isn't known
+        """
+        if not part_path or not os.path.exists(part_path):
+            return None
+
+        try:
+            with open(part_path + PART_INFO_SUFFIX) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def remove_partial(part_path: str = None):
+        """
+        :param part_path: a partial download. It and its PART_INFO_SUFFIX file are removed if they exist.
+        """
+        for path in (part_path, part_path + PART_INFO_SUFFIX) if part_path else ():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def candidate_urls(self) -> list:
+        """
+        :return: URLs the PDF might be at, best first: fix_url's, then the landing page's citation_pdf_url,
+                 then the URL itself. With domain_stats, the kind that has worked best on the host comes first.
+        """
+        candidates = [('fix_url', self.fix_url()), ('url', self.url)]
+
+        if self.landing is not None:
+            candidates.insert(1, ('citation_pdf_url', self.landing.meta.get('citation_pdf_url')))
+
+        self.candidates = {}
+        for kind, url in candidates:
+            if url and url not in self.candidates:
+                self.candidates[url] = kind
+
+        urls = list(self.candidates)
+
+        if self.domain_stats is not None and len(urls) > 1:
+            order = self.domain_stats.order(self.site_url(), [CANDIDATE + self.candidates[url] for url in urls])
+            urls.sort(key=lambda url: order.index(CANDIDATE + self.candidates[url]))
+
+        return urls
+
+    def site_url(self) -> str:
+        """
+        :return: the landing page URL, which domain_stats keys the result's host by
+        """
+        return self.landing.url if self.landing is not None else self.original_url
+
+    def record_candidates(self, outcomes: dict):
+        """
+        :param outcomes: candidate URL -> whether the PDF was got from it
+        :return: None
+        """
+        if self.domain_stats is None or len(self.candidates) < 2:
+            return
+
+        for url, success in outcomes.items():
+            if url in self.candidates:
+                self.domain_stats.record(self.site_url(), CANDIDATE + self.candidates[url], success)
+
+    def check_response(self, r, offset: int = 0):
+        """
+        :param r: streamed response to a request for the PDF
+        :param offset: where in the file the request asked the response to start (with a Range header)
+        :return: None if the response looks like the PDF, otherwise what's wrong with it, as arguments for log
+        """
+        if not (r.status_code == 200 or (r.status_code == 206 and offset)):
+            return dict(reason=f'Could not access PDF URL. HTTP Error: {r.status_code} ({r.reason})', code=HTTP_STATUS,
+                        url=r.url, status=r.status_code)
+
+        if 'pdf' not in r.headers.get('content-type', '').lower():
+            return dict(reason=f"No PDF content at URL. Content-Type: {r.headers.get('content-type')}", code=NOT_PDF,
+                        url=r.url, status=r.status_code)
+
+        if self.max_pdf_size and offset + int(r.headers.get('content-length') or 0) > self.max_pdf_size:
+            return dict(reason=f"PDF is larger than {self.max_pdf_size} bytes ({r.headers['content-length']})",
+                        code=TOO_LARGE, url=r.url)
+
+        return None
+
+    def race(self, urls: list, part_path: str = None):
+        """
+        :param urls: candidate PDF URLs, best first
+        :param part_path: see save_stream
+        :return: see get_pdf
+
+        Requests the first URL, and every HEDGE_DELAY seconds without a PDF (or straight away once
+        all the requests so far have failed) the next one as well. The first response whose body
+        starts like a PDF is saved; the others are closed as soon as they answer. Gives up at the
+        result's deadline.
+        """
+        cond = threading.Condition()
+        race = {'winner': None, 'running': 0, 'failures': {}}
+
+        def attempt(url):
+            failure, r = None, None
+
+            try:
+                if self.landing is not None and self.landing.url == url and not self.headers:
+                    r = self.landing.response
+                else:
+                    r = web.get(url, headers=dict(self.headers), allow_redirects=True, stream=True,
+                                deadline=self.deadline)
+            except Exception as e:
+                failure = dict(reason=f'Could not get PDF. Exception: {e}', code=code_for(e), url=url)
+
+            if r is not None:
+                failure = self.check_response(r)
+
+            if failure is None:
+                chunks = r.iter_content(CHUNK_SIZE)
+                head = b''
+
+                try:
+                    for chunk in chunks:
+                        head += chunk
+
+                        if len(head) >= 1024:
+                            break
+                except Exception as e:
+                    failure = dict(reason=f'Could not download PDF. Error: {e}', code=code_for(e), url=r.url)
+                else:
+                    if b'%PDF' not in head[:1024]:
+                        failure = dict(reason='Content at URL is not a PDF (no %PDF header)', code=NOT_PDF, url=r.url)
+
+            with cond:
+                race['running'] -= 1
+
+                if failure is None and race['winner'] is None:
+                    race['winner'] = (r, chain([head], chunks), url)
+                elif r is not None:
+                    # Lost the race, or not a PDF
+                    r.close()
+
+                if failure is not None:
+                    race['failures'][url] = failure
+
+                cond.notify_all()
+
+        def wait(until=None):
+            # until=None waits for a winner or for every request to finish, however long that takes
+            while race['winner'] is None and race['running'] and (until is None or time.monotonic() < until):
+                cond.wait(None if until is None else until - time.monotonic())
+
+        deadline = self.deadline
+
+        with cond:
+            for url in urls:
+                race['running'] += 1
+                threading.Thread(target=attempt, args=(url,), daemon=True).start()
+
+                hedge = time.monotonic() + HEDGE_DELAY
+                wait(hedge if deadline is None else min(hedge, deadline))
+
+                if race['winner'] is not None or (deadline is not None and time.monotonic() >= deadline):
+                    break
+
+            wait(deadline)
+
+            winner, running = race['winner'], race['running']
+            failures = [race['failures'][url] for url in urls if url in race['failures']]
+            failed = list(race['failures'])
+
+            # Tell any requests still running that they have lost
+            race['winner'] = race['winner'] or (None, None, None)
+
+        self.record_candidates({url: False for url in failed})
 
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        headers = {'User-Agent': user_agent}
+        if winner is None:
+            if failures and not running:
+                self.log(**failures[0])
+            else:
+                self.log(reason=f'No PDF from {len(urls)} candidate URLs within the deadline', code=TIMEOUT,
+                         url=urls[0])
+            return None
+
+        r, chunks, url = winner
+
+        with r:
+            path = self.save_stream(r, part_path, chunks=chunks, url=url)
+
+        self.record_candidates({url: path is not None})
+
+        return path
+
+    def fetch_pdf(self, url: str, filename: str = None, source: dict = None):
+        """
+        :param url: the PDF's URL, from fix_url
+        :param filename: see get_pdf
+        :param source: see partial_source. The partial download is continued if it came from url.
+        :return: see get_pdf
+        """
+        part_path = f'{self.save_location}/{filename}.part' if filename else None
+        validator = (source or {}).get('etag') or (source or {}).get('last_modified')
+        offset = 0
+
+        if validator and source.get('url') == url and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+
+        headers = dict(self.headers)
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            # If the PDF has changed since, the server sends the whole new one instead of the rest of the old one
+            headers['If-Range'] = validator
+
+        reuse = self.landing is not None and self.landing.url == url and not headers
+
+        if not reuse and self.landing is not None and self.landing.is_pdf:
+            # An unread PDF body holds a slot for its host, which this request may need
+            self.landing.close()
 
         try:
-            r = requests.get(url, headers=headers, allow_redirects=True, timeout=(10, 10))
+            if reuse:
+                r = self.landing.response
+            else:
+                r = web.get(url, headers=headers, allow_redirects=True, stream=True, deadline=self.deadline)
         except Exception as e:
-            self.log(reason=f'Could not get PDF. Exception: {e}')
+            self.log(reason=f'Could not get PDF. Exception: {e}', code=code_for(e), url=url)
             return None
 
-        if r.status_code != 200:
-            self.log(reason=f'Could not access PDF URL. HTTP Error: {r.status_code} ({r.reason}')
+        with r:
+            if r.status_code == 200:
+                # Either a fresh download or the server ignored the Range header, so start from scratch
+                offset = 0
+
+            failure = self.check_response(r, offset)
+
+            if failure is not None:
+                self.log(**failure)
+                return None
+
+            return self.save_stream(r, part_path, offset, url=url)
+
+    def save_stream(self, r, part_path: str = None, offset: int = 0, chunks=None, url: str = None):
+        """
+        :param r: a streamed requests.Response
+        :param part_path: file to write to. A temporary file is made if not given.
+        :param offset: number of bytes already in part_path that r continues from (an HTTP 206 response)
+        :param chunks: the body as an iterator of bytes, if some of it has already been read from r
+        :param url: the URL that was requested for r, which a partial download is continued from
+        :return: path to the file the body was written to, or None if it was rejected.
+
+        Aborts as soon as the first bytes show the body isn't a PDF, once it passes max_pdf_size, or
+        when the result's deadline passes. If the connection drops (or the deadline passes) part way, the
+        server supports ranges and the PDF has an ETag or Last-Modified date, the partial file is kept so the
+        next run can pick up where this one stopped.
+        """
+        if chunks is None:
+            chunks = r.iter_content(CHUNK_SIZE)
+
+        head = b''
+        try:
+            for chunk in chunks:
+                head += chunk
+
+                if len(head) >= 1024:
+                    break
+        except Exception as e:
+            self.log(reason=f'Could not download PDF. Error: {e}', code=code_for(e), url=r.url)
             return None
 
-        if 'pdf' in r.headers.get('content-type').lower():
-            return r.content
-        else:
-            self.log(reason=f'No PDF content at URL. HTTP Error: {r.status_code} ({r.reason}')
+        # The PDF header should come first, but the spec allows junk before it within the first 1024 bytes.
+        # A resumed download starts mid-file; its beginning was checked when it was first written.
+        if not offset and b'%PDF' not in head[:1024]:
+            self.log(reason='Content at URL is not a PDF (no %PDF header)', code=NOT_PDF, url=r.url)
+            return None
+
+        etag = r.headers.get('etag')
+        validators = {'etag': etag if etag and not etag.startswith('W/') else None,
+                      'last_modified': r.headers.get('last-modified')}
+
+        # Only a named partial download that knows where it came from, and can tell if the PDF changed, is kept
+        resumable = part_path is not None and url is not None and (offset or any(validators.values())) and \
+            (r.status_code == 206 or r.headers.get('accept-ranges', '').lower() == 'bytes')
+
+        if part_path is None:
+            fd, part_path = tempfile.mkstemp(dir=self.save_location, suffix='.part')
+            os.close(fd)
+
+        digest = hashlib.sha256()
+        if offset:
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(block)
+
+        size = offset
+
+        self.telemetry.add_bytes(r.url, len(head))
+
+        try:
+            if resumable and not offset:
+                with open(part_path + PART_INFO_SUFFIX, 'w') as f:
+                    json.dump(dict(url=url, **validators), f)
+
+            with open(part_path, 'ab' if offset else 'wb') as out:
+                for chunk in chain([head], chunks):
+                    size += len(chunk)
+
+                    if self.max_pdf_size and size > self.max_pdf_size:
+                        raise ValueError(f'PDF is larger than {self.max_pdf_size} bytes')
+
+                    if self.deadline is not None and time.monotonic() > self.deadline:
+                        raise requests.Timeout(f'Download took longer than the deadline ({size} bytes received)')
+
+                    out.write(chunk)
+                    digest.update(chunk)
+
+                    if chunk is not head:
+                        self.telemetry.add_bytes(r.url, len(chunk))
+        except ValueError as e:
+            self.remove_partial(part_path)
+            self.log(reason=f'Could not download PDF. Error: {e}', code=TOO_LARGE, url=r.url)
             return None
+        except Exception as e:
+            if not resumable:
+                self.remove_partial(part_path)
+
+            self.log(reason=f'Could not download PDF. Error: {e}', code=code_for(e), url=r.url)
+            return None
+
+        self.pdf_url = r.url
+        self.pdf_size = size
+        self.pdf_sha256 = digest.hexdigest()
 
-    def write_pdf(self, pdf_data: bytes, filename: str):
-        if pdf_data:
+        return part_path
+
+    def write_pdf(self, pdf_path: str, filename: str) -> bool:
+        """
+        :param pdf_path: file returned by get_pdf
+        :param filename: name to give the PDF in save_location
+        :return: True if the PDF was saved
+
+        The rename is atomic, so a crash can never leave a truncated PDF under its final name.
+        With a PDFStore the file is moved into the store instead and linked into save_location.
+        """
+        if pdf_path:
             try:
-                with open(f'{self.save_location}/{filename}', 'wb') as out:
-                    out.write(pdf_data)
+                if self.store is not None:
+                    self.store.add(pdf_path, self.pdf_sha256, self.store_keys())
+                    self.store.place(self.pdf_sha256, f'{self.save_location}/{filename}')
+                else:
+                    os.replace(pdf_path, f'{self.save_location}/{filename}')
+
+                # The PDF has moved, so this only removes where the partial download came from
+                self.remove_partial(pdf_path)
+
+                return True
             except Exception as e:
-                self.log(reason=f'Could not write data to PDF. Error: {e}')
+                self.remove_partial(pdf_path)
+                self.log(reason=f'Could not write data to PDF. Error: {e}', code=WRITE_ERROR)
         else:
-            self.log(reason='No PDF data found.')
+            self.log(reason='No PDF data found.', code=NO_PDF, url=self.url)
+
+        return False
+
+    def store_keys(self) -> list:
+        """
+        :return: PDFStore keys for every DOI/URL this PDF could be looked up by next time
+        """
+        doi = self.landing.meta.get('citation_doi') if self.landing is not None else None
+
+        return keys_for(self.bib_info.get('url'),
+                        f'http://dx.doi.org/{doi}' if doi else None,
+                        self.landing.url if self.landing is not None else None,
+                        self.original_url,
+                        self.pdf_url)
 
     def write_json(self, json_data: dict, filename: str):
         with open(f"{self.save_location}/{filename.replace('.pdf', '.json')}", 'w') as f:
@@ -259,45 +1239,57 @@ class BaseGrabber:
     def fix_url(self):
         return self.url
 
-    def log(self, reason=None):
-        os.makedirs(f'{self.save_location}/logs', exist_ok=True)
-
-        self.bib_info['Reason_for_failure'] = reason
-
-        with open(f'{self.save_location}/logs/failed_to_get_PDF_{self.label}.txt', 'a') as out:
-            out.write('\n')
-            json.dump(self.bib_info, out)
-            out.write(f'\n')
-            out.write('='*70)
+    def log(self, reason=None, code=ERROR, url=None, status=None):
+        """
+        Keeps the first failure for GrabOne to write to the failure ledger, see GrabOne.log
+        """
+        if self.failure is None:
+            self.failure = (code, reason, url, status)
 
 class NoURL(BaseGrabber):
     """
     Dummy class for results with no URL
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
-
     def run(self, filename):
-        self.log(reason=f'No DOI was available from search result.')
+        self.log(reason=f'No DOI was available from search result.', code=NO_URL)
+
+
+class StoredPDF(BaseGrabber):
+    """
+    The PDF is already in the shared PDFStore, so it is linked into place instead of downloaded.
+    """
+    def __init__(self, save_location: str, bib_info: dict, label: str, url: str, store: PDFStore, sha256: str,
+                 telemetry: Telemetry = None):
+        super().__init__(save_location, bib_info, label, url, store=store, telemetry=telemetry)
+        self.pdf_sha256 = sha256
+        self.pdf_size = store.blob_path(sha256).stat().st_size
+
+    def get_pdf(self, filename: str = None):
+        return str(self.store.blob_path(self.pdf_sha256))
+
+    def write_pdf(self, pdf_path: str, filename: str) -> bool:
+        try:
+            self.store.place(self.pdf_sha256, f'{self.save_location}/{filename}')
+            return True
+        except Exception as e:
+            self.log(reason=f'Could not link stored PDF. Error: {e}', code=WRITE_ERROR)
+            return False
 
 
 class CitationPDFURL(BaseGrabber):
     """
     Link to PDF is in metadata
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
-
     def fix_url(self):
         return self.url
 
 
+@register_grabber
 class PanAfricanGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('panafrican-med-journal.com',)
 
     def fix_url(self):
         fname = self.url.split('/')[-2]
@@ -307,12 +1299,12 @@ class PanAfricanGrabber(BaseGrabber):
         return f"{new_url}{fname}.pdf"
 
 
+@register_grabber
 class LiebertGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('liebertpub.com',)
 
     def fix_url(self):
         new_url = self.url.replace('/doi/', '/doi/pdf/')
@@ -320,12 +1312,12 @@ class LiebertGrabber(BaseGrabber):
         return new_url
 
 
+@register_grabber
 class JFoodGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('jfoodprotection.org',)
 
     def fix_url(self):
         new_url = self.url.replace('/doi/', '/doi/pdf/')
@@ -333,12 +1325,12 @@ class JFoodGrabber(BaseGrabber):
         return new_url
 
 
+@register_grabber
 class AkademiaiGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('akademia.com',)
 
     def fix_url(self):
         new_url = self.url.replace('/doi/', '/doi/pdf/')
@@ -346,12 +1338,12 @@ class AkademiaiGrabber(BaseGrabber):
         return new_url
 
 
+@register_grabber
 class SagePubGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('sagepub.com',)
 
     def fix_url(self):
         new_url = self.url.replace('/doi/', '/doi/pdf/')
@@ -359,17 +1351,17 @@ class SagePubGrabber(BaseGrabber):
         return new_url
 
 
+@register_grabber
 class IJPSRGrabber(BaseGrabber):
     """
     Parse HTML and get PDF link
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ijpsr.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             a_tag = [i for i in html.find_all('a') if i.get('href').endswith('.pdf')][0]
 
             return a_tag.get('href')
@@ -377,16 +1369,16 @@ class IJPSRGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class MedwellGrabber(BaseGrabber):
     """
     Parse HTML and get PDF link
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('medwelljournals.com',)
+    needs_body = True
 
     def fix_url(self):
-        data = requests.get(self.url, timeout=(10,10))
-        html = BeautifulSoup(data.content, 'lxml')
+        html = self.get_landing().html
         a_tag = html.find('a', string='Fulltext PDF')
 
         if a_tag:
@@ -395,17 +1387,17 @@ class MedwellGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class AJTMHGrabber(BaseGrabber):
     """
     Parse HTML and get PDF link
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ajtmh.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             link = html.find("a", attrs={'class': "pdf"})
             
             return f"https://www.ajtmh.org{link.get('href')}"
@@ -414,17 +1406,17 @@ class AJTMHGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class TandFGrabber(BaseGrabber):
     """
     Parse HTML and get PDF link
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('tandfonline.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             link = html.find("a", attrs={'class': "show-pdf"})
 
             return f"https://www.tandfonline.com{link.get('href')}"
@@ -433,17 +1425,17 @@ class TandFGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class EKBGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ekb.eg',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -451,17 +1443,17 @@ class EKBGrabber(BaseGrabber):
         except:
             return self.url
 
+@register_grabber
 class CDCGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('cdc.gov',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -470,17 +1462,17 @@ class CDCGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class HumanKineticsGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('humankinetics.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -489,17 +1481,17 @@ class HumanKineticsGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class BiooneGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('bioone.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -508,17 +1500,17 @@ class BiooneGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class JsavaGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('jsava.co.za',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -527,17 +1519,17 @@ class JsavaGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class AJOLGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ajol.info',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -545,17 +1537,17 @@ class AJOLGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class SpringerOpenGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('springeropen.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -563,17 +1555,17 @@ class SpringerOpenGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class IndianJournalsGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('indianjournals.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -581,17 +1573,17 @@ class IndianJournalsGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class FrontiersGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('frontiersin.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -599,17 +1591,17 @@ class FrontiersGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class HindawiGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('hindawi.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -617,17 +1609,17 @@ class HindawiGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class ASMAEMGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('aem.asm.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -635,17 +1627,17 @@ class ASMAEMGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class OUPGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('oup.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -653,17 +1645,17 @@ class OUPGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class JIDCGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('jidc.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -671,12 +1663,12 @@ class JIDCGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class SciAlertGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('scialert.net',)
 
     def fix_url(self):
         new_url = self.url.replace('/abstract/', '/qredirect.php')
@@ -684,17 +1676,17 @@ class SciAlertGrabber(BaseGrabber):
         return f"{new_url}&linkid=pdf"
 
 
+@register_grabber
 class EJManagerGrabber(BaseGrabber):
     """
     Extract window.location from Javascript redirect.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ejmanager.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            # html = BeautifulSoup(data.content, 'lxml')
+            data = self.get_landing()
             redirmatch = re.match(r'.*?window\.location\s*=\s*\"([^"]+)\"', str(data.content), re.M|re.S)
 
             if redirmatch and "http" in redirmatch.group(1):
@@ -706,17 +1698,17 @@ class EJManagerGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class OJVRGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ojvr.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name":'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -724,17 +1716,17 @@ class OJVRGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class CambridgeGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('cambridge.org',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name":'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -742,51 +1734,51 @@ class CambridgeGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class PlosGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('journals.plos.org',)
 
     def fix_url(self):
         new_url = self.url.replace('/article?', '/article/file?')
         return f"{new_url}&type=printable"
 
 
+@register_grabber
 class VetWorldGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('veterinaryworld.org',)
 
     def fix_url(self):
         return self.url.replace('.html', '.pdf')
 
 
+@register_grabber
 class BiomedcentralGrabber(BaseGrabber):
     """
     Link to article needs URL changed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('biomedcentral.com',)
 
     def fix_url(self):
         return self.url.replace('/articles/', '/track/pdf/')
 
 
+@register_grabber
 class SpringerGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('springer.com',)
+    needs_body = True
 
     def fix_url(self):
         try:
-            data = requests.get(self.url, timeout=(10,10))
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             return meta.attrs['content']
@@ -794,60 +1786,40 @@ class SpringerGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class ScienceDirectGrabber(BaseGrabber):
     """
     Need to append parameter to the URL to avoid JavaScript mess
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('sciencedirect.com',)
 
     def fix_url(self,):
         return self.url + "/pdfft?isDTMRedir=true&download=true"
 
 
+@register_grabber
 class AcademiaEduGrabber(BaseGrabber):
     """
     Will only let you get the PDF if you are coming from Google.
     Spoof a Google Scholar referer.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
-
-    def get_pdf(self):
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        referer = "https://scholar.google.co.uk/scholar?hl=en&as_sdt=0%2C5&q=academic+paper&btnG="
-        headers = {'User-Agent': user_agent, 'referer': referer}
-
-        try:
-            r = requests.get(self.url, headers=headers, allow_redirects=True, timeout=(10,10))
-        except :
-            print(f'Error: {self.url}')
-            return None
+    domains = ('academia.edu',)
 
-        if 'pdf' in r.headers.get('content-type').lower():
-            return r.content
-        else:
-            return None
+    headers = {'referer': "https://scholar.google.co.uk/scholar?hl=en&as_sdt=0%2C5&q=academic+paper&btnG="}
 
 
+@register_grabber
 class WileyGrabber(BaseGrabber):
     """
     Need to specify User-Agent.
     Will try to render PDF using JavaScript via ReadCube.com, so change URL to go direct to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('wiley.com',)
+    needs_body = True
 
     def fix_url(self):
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        headers = {'User-Agent': user_agent}
-
         try:
-            data = requests.get(self.url, headers=headers, timeout=(10,10))
-
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
             new_url = meta.attrs['content']
@@ -858,22 +1830,17 @@ class WileyGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class NIHGrabber(BaseGrabber):
     """
     Base URL needs fixed to point to PDF.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('ncbi.nlm.nih.gov',)
+    needs_body = True
 
     def fix_url(self):
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        headers = {'User-Agent': user_agent}
-
         try:
-            data = requests.get(self.url, headers=headers, timeout=(10,10))
-
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
 
             meta = html.find('link', attrs={"type": 'application/pdf'})
 
@@ -883,22 +1850,17 @@ class NIHGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class ScieloGrabber(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('scielo.org.za',)
+    needs_body = True
 
     def fix_url(self,):
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        headers = {'User-Agent': user_agent}
-
         try:
-            data = requests.get(self.url, headers=headers, timeout=(10,10))
-
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
 
             meta = html.find('meta', attrs={"name": 'citation_pdf_url'})
 
@@ -908,22 +1870,17 @@ class ScieloGrabber(BaseGrabber):
             return self.url
 
 
+@register_grabber
 class MicroBioResearch(BaseGrabber):
     """
     The HTML has a well-defined link to the PDF's direct url.
     """
-    def __init__(self, save_location: str, bib_info: dict, label: str, url: str):
-        super().__init__(save_location, bib_info, label, url)
+    domains = ('microbiologyresearch.org',)
+    needs_body = True
 
     def fix_url(self,):
-        user_agent = "Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like " \
-                     "Firefox/3.5.5; Debian-3.5.5-1) "
-        headers = {'User-Agent': user_agent}
-
         try:
-            data = requests.get(self.url, headers=headers, timeout=(10,10))
-
-            html = BeautifulSoup(data.content, 'lxml')
+            html = self.get_landing().html
 
             meta = html.find('div', attrs={"class":"ft-download-content ft-download-content--pdf"})
 
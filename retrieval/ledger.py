@@ -0,0 +1,131 @@
+"""
+Machine-readable record of every result GrabAll failed to download.
+
+Each failure is one JSON line in '<pdf_folder>/logs/failures_<label>.jsonl' with a reason
+code, so failures can be counted by cause and replayed without repeating the search:
+read_failures() turns a ledger back into results that grab.download() accepts.
+"""
+import json
+import time
+import threading
+import requests
+
+from pathlib import Path
+
+from . import web
+
+# Reason codes
+NO_URL = 'no_url'                        # the search result had no DOI or URL
+DOI_UNRESOLVED = 'doi_unresolved'        # dx.doi.org didn't redirect anywhere useful
+HTTP_STATUS = 'http_status'              # the landing page or PDF URL answered with an error status
+NOT_PDF = 'not_pdf'                      # the content at the PDF URL wasn't a PDF
+TOO_LARGE = 'too_large'                  # the PDF was bigger than max_pdf_size
+TIMEOUT = 'timeout'
+CONNECTION = 'connection'                # couldn't connect, or the connection dropped mid-download
+HOST_UNAVAILABLE = 'host_unavailable'    # skipped because the host's circuit breaker was open
+NO_PDF = 'no_pdf'                        # the grabber couldn't find a PDF link on the landing page
+WRITE_ERROR = 'write_error'              # the PDF was fetched but couldn't be saved
+LOW_SUCCESS = 'low_success_host'         # skipped because PDFs have almost never been got from the host
+SCREENED_OUT = 'screened_out'            # not downloaded because its title and abstract were screened out
+ERROR = 'error'                          # anything else
+
+
+def code_for(e: Exception) -> str:
+    """
+    :param e: exception raised while resolving or downloading
+    :return: the reason code that best describes it
+    """
+    if isinstance(e, web.HostUnavailable):
+        return HOST_UNAVAILABLE
+
+    if isinstance(e, requests.Timeout) or 'timed out' in str(e).lower():
+        return TIMEOUT
+
+    if isinstance(e, requests.ConnectionError):
+        return CONNECTION
+
+    return ERROR
+
+
+class FailureLedger:
+    def __init__(self, folder, label: str):
+        """
+        :param folder: the PDF folder. The ledger goes in its logs/ subfolder.
+        :param label: label of the query being downloaded
+        """
+        self.label = label
+        self.path = Path(folder).expanduser() / 'logs' / f'failures_{label}.jsonl'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.counts = {}
+
+        self._lock = threading.Lock()
+        self._out = None
+
+    def record(self, name: str, code: str, reason: str, result: dict, url: str = None, status: int = None):
+        """
+        :param name: the result's saved_pdf_name
+        :param code: one of the reason codes above
+        :param reason: human-readable description of the failure
+        :param result: the search result, as it appears in the Query's results
+        :param url: the URL that was being fetched when it failed, if any
+        :param status: HTTP status code, if the failure was an HTTP error
+        :return: None
+        """
+        line = json.dumps(dict(name=name, label=self.label, code=code, reason=reason, url=url, status=status,
+                               time=time.time(), result=result))
+
+        with self._lock:
+            if self._out is None:
+                self._out = open(self.path, 'a')
+
+            self._out.write(line + '\n')
+            self.counts[code] = self.counts.get(code, 0) + 1
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+def read_failures(path, codes=None) -> list:
+    """
+    :param path: a failures_<label>.jsonl ledger
+    :param codes: only return failures with one of these reason codes. None returns every failure.
+    :return: ledger records, the latest one for each saved_pdf_name
+    """
+    records = {}
+
+    with open(Path(path).expanduser()) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Most likely the last line of a run that crashed mid-write
+                continue
+
+            records[record['name']] = record
+
+    return [r for r in records.values() if codes is None or r['code'] in codes]
+
+
+class Replay:
+    """
+    Stands in for a search.Query whose results are the failures in a ledger, so they can be passed
+    to grab.download() again.
+    """
+    def __init__(self, path, codes=None):
+        """
+        :param path: a failures_<label>.jsonl ledger
+        :param codes: only replay failures with one of these reason codes. None replays every failure.
+        """
+        records = read_failures(path, codes)
+
+        self.label = records[0]['label'] if records else Path(path).stem.replace('failures_', '', 1)
+
+        self.data = {'metadata': {'source': 'replay',
+                                  'label': self.label,
+                                  'ledger': str(path),
+                                  'codes': sorted(codes) if codes else None},
+                     'results': [r['result'] for r in records]}
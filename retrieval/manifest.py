@@ -0,0 +1,130 @@
+"""
+Per-folder record of what GrabAll has already downloaded, so an interrupted or partly
+failed run can be repeated without fetching everything again.
+
+The manifest is a JSON-lines file in the PDF folder with one record per saved_pdf_name.
+Records are appended as results finish and the latest one for a name wins, which keeps
+writes cheap and means a crash can at worst lose the line being written.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+from pathlib import Path
+
+COMPLETE = 'complete'
+PARTIAL = 'partial'
+FAILED = 'failed'
+# Not attempted because the host's circuit breaker was open
+DEFERRED = 'deferred'
+
+
+def sha256_file(path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class Manifest:
+    FILENAME = 'manifest.jsonl'
+
+    def __init__(self, folder):
+        """
+        :param folder: the PDF folder this manifest describes. Created if it doesn't exist.
+        """
+        self.folder = Path(folder).expanduser()
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        self.path = self.folder / self.FILENAME
+        self.records = {}
+
+        self._lock = threading.Lock()
+        self._name_locks = {}
+
+        lines = 0
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Most likely the last line of a run that crashed mid-write
+                        continue
+
+                    self.records[record['name']] = record
+
+        if lines != len(self.records):
+            self._compact()
+
+        self._out = open(self.path, 'a')
+
+    def _compact(self):
+        tmp_path = self.path.with_suffix('.tmp')
+
+        with open(tmp_path, 'w') as out:
+            for record in self.records.values():
+                out.write(json.dumps(record) + '\n')
+
+        os.replace(tmp_path, self.path)
+
+    def get(self, name: str) -> dict:
+        return self.records.get(name)
+
+    def record(self, name: str, status: str, **fields):
+        """
+        :param name: the result's saved_pdf_name
+        :param status: COMPLETE, PARTIAL, FAILED or DEFERRED
+        :param fields: anything else worth keeping, e.g. url, final_url, size, sha256
+        """
+        record = dict(name=name, status=status, updated=time.time(), **fields)
+
+        with self._lock:
+            self.records[name] = record
+            self._out.write(json.dumps(record) + '\n')
+            self._out.flush()
+
+    def is_complete(self, name: str) -> bool:
+        """
+        :param name: the result's saved_pdf_name
+        :return: True if a valid PDF for this result is already in the folder
+
+        A PDF that exists but isn't in the manifest (e.g. from a run before manifests existed)
+        is accepted if it looks like a PDF, and is added to the manifest.
+        """
+        pdf_path = self.folder / name
+
+        if not pdf_path.is_file():
+            return False
+
+        record = self.get(name)
+
+        if record is not None and record['status'] == COMPLETE:
+            return record.get('size') == pdf_path.stat().st_size
+
+        with open(pdf_path, 'rb') as f:
+            if b'%PDF' not in f.read(1024):
+                return False
+
+        self.record(name, COMPLETE, size=pdf_path.stat().st_size, sha256=sha256_file(pdf_path))
+
+        return True
+
+    def name_lock(self, name: str):
+        """
+        :param name: the result's saved_pdf_name
+        :return: a lock held while a result is downloaded, so two results sharing a file name
+                 never write to the same file at the same time
+        """
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def close(self):
+        with self._lock:
+            self._out.close()
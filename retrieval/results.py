@@ -0,0 +1,252 @@
+"""
+Write and read back the results files that search.Query saves, so their PDFs can be downloaded
+again without repeating the search (and spending API quota or the WoS request budget).
+
+A results file is either the original JSON ({"metadata": ..., "results": [...]}) or JSON Lines,
+used when the file name ends in '.jsonl': a {"metadata": ...} header line followed by one compact
+line per result. ResultsWriter appends each JSON Lines result as soon as it has been processed, so
+a search that fails part way keeps everything it had found.
+
+Both kinds are parsed incrementally: results are decoded one at a time as they are needed, so a
+large results file never has to be held in memory all at once.
+"""
+import json
+
+from pathlib import Path
+
+from .manifest import Manifest, COMPLETE
+
+# Characters read from a results file at a time
+READ_SIZE = 64 * 1024
+
+# Filters for SavedResults
+MISSING = 'missing'    # results whose PDF isn't in the PDF folder
+FAILED = 'failed'      # results an earlier download attempted and didn't save
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """
+    Hands out JSON values from a file one at a time, reading more of the file only when needed.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+
+        data = self.f.read(READ_SIZE)
+
+        if not data:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+        return True
+
+    def peek(self) -> str:
+        """
+        :return: the next character that isn't whitespace, or '' at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} in results file, found {self.peek()!r}')
+
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # Probably only part of the value has been read so far
+                if self._fill():
+                    continue
+                raise
+
+            # A number at the very end of the buffer might continue in the next read
+            if end == len(self.buffer) and self._fill():
+                continue
+
+            self.pos = end
+
+            return value
+
+
+def is_jsonl(path) -> bool:
+    """
+    :return: True if results should be saved to path as JSON Lines
+    """
+    return Path(path).suffix.lower() == '.jsonl'
+
+
+class ResultsWriter:
+    """
+    Writes a JSON Lines results file one result at a time.
+    """
+    def __init__(self, path, metadata: dict):
+        """
+        :param path: file to write. Replaced if it exists.
+        :param metadata: the Query's metadata, written as the header line
+        """
+        self.path = Path(path).expanduser()
+        self.count = 0
+
+        if self.path.parent.parts:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._out = open(self.path, 'w')
+        self._write({'metadata': metadata})
+
+    def _write(self, record: dict):
+        self._out.write(json.dumps(record, separators=(',', ':')) + '\n')
+        # Flushed every line, so a crash loses at most the result being written
+        self._out.flush()
+
+    def write(self, result: dict):
+        self._write(result)
+        self.count += 1
+
+    def close(self):
+        self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_jsonl(f, metadata: dict = None):
+    for n, line in enumerate(f):
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+
+        if n == 0 and set(record) == {'metadata'}:
+            if metadata is not None:
+                metadata.update(record['metadata'])
+            continue
+
+        yield record
+
+
+def read_results(path, metadata: dict = None):
+    """
+    :param path: a results file written by search.Query, as JSON or JSON Lines
+    :param metadata: if given, filled in with the file's metadata as soon as it has been read
+    :return: generator of the file's results, decoded one at a time
+    """
+    with open(Path(path).expanduser()) as f:
+        first = f.readline()
+
+        try:
+            header = json.loads(first)
+        except ValueError:
+            # The first line of an indented JSON file is just '{'
+            header = None
+
+        if isinstance(header, dict) and 'results' not in header:
+            f.seek(0)
+            yield from _read_jsonl(f, metadata)
+            return
+
+        f.seek(0)
+        reader = _Reader(f)
+        reader.expect('{')
+
+        while reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+
+            if key != 'results' or reader.peek() != '[':
+                value = reader.value()
+
+                if key == 'metadata' and metadata is not None:
+                    metadata.update(value)
+            else:
+                reader.expect('[')
+
+                while reader.peek() != ']':
+                    yield reader.value()
+
+                    if reader.peek() == ',':
+                        reader.expect(',')
+
+                reader.expect(']')
+
+            if reader.peek() == ',':
+                reader.expect(',')
+
+
+class SavedResults:
+    """
+    Stands in for a search.Query whose search has already been run and saved, so that its results
+    can be passed to grab.download(..., pipeline=True) and downloaded without searching again.
+    """
+    def __init__(self, results_file, pdf_folder=None, only: str = None):
+        """
+        :param results_file: JSON or JSON Lines results written by search.Query
+        :param pdf_folder: the folder the PDFs are downloaded to. Needed for `only`.
+        :param only: None for every result, MISSING for results whose PDF isn't in pdf_folder, or
+                     FAILED for those an earlier download of pdf_folder attempted but didn't save
+        """
+        if only is not None and pdf_folder is None:
+            raise ValueError('pdf_folder is needed to filter results')
+
+        self.results_file = Path(results_file).expanduser()
+        self.pdf_folder = Path(pdf_folder).expanduser() if pdf_folder is not None else None
+        self.only = only
+
+        # Metadata comes before the results in the file, so only this much is read to find the label
+        metadata = {}
+        next(read_results(self.results_file, metadata), None)
+
+        self.label = metadata.get('label') or self.results_file.stem
+        self.data = {'metadata': metadata, 'results': None}
+
+    def wanted(self, result: dict, attempted: dict) -> bool:
+        if self.only is None:
+            return True
+
+        path = self.pdf_folder / result['saved_pdf_name']
+
+        if path.is_file() and path.stat().st_size:
+            return False
+
+        if self.only == FAILED:
+            return attempted.get(result['saved_pdf_name'], COMPLETE) != COMPLETE
+
+        return True
+
+    def iter_results(self):
+        """
+        :return: generator of the saved results, filtered by `only`
+        """
+        attempted = {}
+
+        if self.only == FAILED:
+            manifest = Manifest(self.pdf_folder)
+            attempted = {name: record['status'] for name, record in manifest.records.items()}
+            manifest.close()
+
+        for result in read_results(self.results_file):
+            if self.wanted(result, attempted):
+                yield result
@@ -0,0 +1,79 @@
+"""
+Runs a batch of queries with one queue per search engine, so queries to different engines run at
+the same time and each engine only waits out its own rate limit.
+
+Queries to the same engine run one after another, and each starts at least that engine's interval
+after the previous one started. The download of a query's PDFs counts towards the wait, so a slow
+download followed by the next query needs no extra sleep.
+"""
+import time
+import threading
+import traceback
+
+# Least seconds between the starts of two queries to the same engine
+ENGINE_INTERVALS = {'wos': 80.0,      # Web of Science Lite allows about one query a minute; kept as before
+                    'pubmed': 1.0,    # NCBI allows 3 requests a second without an API key (pymed paces its own)
+                    'scopus': 1.0,    # Elsevier allows 9 requests a second per key
+                    'google': 4.0}    # keeps SerpApi's hourly throughput cap out of reach of a long batch
+
+# Interval for an engine that isn't listed above
+DEFAULT_INTERVAL = 1.0
+
+
+class EngineScheduler:
+    def __init__(self, run_query, intervals: dict = None):
+        """
+        :param run_query: called with each query (a dict with at least an 'engine' key) to search and download it
+        :param intervals: engine -> least seconds between the starts of its queries. Defaults to ENGINE_INTERVALS.
+        """
+        self.run_query = run_query
+        self.intervals = dict(ENGINE_INTERVALS, **(intervals or {}))
+
+        # (query, exception) for every query that raised
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def queues(self, queries: list) -> dict:
+        """
+        :param queries: queries in the order given, e.g. the rows of a batch CSV
+        :return: engine -> its queries, still in that order
+        """
+        queues = {}
+
+        for query in queries:
+            queues.setdefault(query['engine'], []).append(query)
+
+        return queues
+
+    def run_engine(self, engine: str, queries: list):
+        interval = self.intervals.get(engine, DEFAULT_INTERVAL)
+        last_start = None
+
+        for query in queries:
+            if last_start is not None:
+                time.sleep(max(0.0, last_start + interval - time.monotonic()))
+
+            last_start = time.monotonic()
+
+            try:
+                self.run_query(query)
+            except Exception as e:
+                # One bad query should not hold up the rest of its engine's queue
+                traceback.print_exc()
+
+                with self._lock:
+                    self.failures.append((query, e))
+
+    def run(self, queries: list):
+        """
+        :param queries: queries to run
+        :return: None. Returns once every engine's queue is finished.
+        """
+        threads = [threading.Thread(target=self.run_engine, args=(engine, engine_queries), name=f'engine-{engine}')
+                   for engine, engine_queries in self.queues(queries).items()]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,123 @@
+"""
+Screen search results on their title and abstract before their PDFs are downloaded.
+
+Most results are excluded at screening anyway, so scoring them with the trained classifier first
+(see classify.py and classifiers/svm_classifier_strategy.py) saves downloading and extracting PDFs
+that would be thrown away. A result is kept if the classifier's decision function for it (its
+signed distance from the include/exclude boundary, positive for include) is at least the
+threshold, and kept results are downloaded most confident first.
+
+Results with no title or abstract in their search metadata (e.g. Web of Science Lite has no
+abstracts, so those results only have a title) are scored on whatever text they do have. A result
+with no text at all can't be judged, so it is kept and downloaded after the scored ones.
+
+Results screened out are written to the failure ledger with the code SCREENED_OUT, so they can be
+downloaded later with grab.retry(ledger_path, output_folder, codes=['screened_out']) if needed.
+"""
+import pickle
+
+from pathlib import Path
+from itertools import islice
+
+# Fields that hold the abstract, or the nearest thing to one, in each search engine's results
+ABSTRACT_FIELDS = ('abstract',       # PubMed
+                   'description',    # Scopus
+                   'snippet')        # Google Scholar
+
+# Results scored at a time when screening results that are still arriving (grab.download(..., pipeline=True))
+SCREEN_BATCH = 100
+
+
+def text_for(result: dict) -> str:
+    """
+    :param result: a search result, as saved in the Query's results
+    :return: its title and abstract, joined the way classifiers/svm_classifier_strategy.format_data does
+    """
+    abstract = next((result[field] for field in ABSTRACT_FIELDS if result.get(field)), '')
+
+    return (result.get('title') or '') + abstract
+
+
+class Screener:
+    def __init__(self, model_path: str, threshold: float = 0.0):
+        """
+        :param model_path: a pickled SVMClassifier trained with classify.py -t, or a pickled sklearn
+                           pipeline with a decision_function
+        :param threshold: smallest decision function value a result may have and still be downloaded.
+                          0 keeps everything the classifier would label include; higher is stricter.
+        """
+        self.model_path = Path(model_path).expanduser()
+        self.threshold = threshold
+
+        with open(self.model_path, 'rb') as f:
+            model = pickle.load(f)
+
+        # An SVMClassifier keeps the fitted vectoriser and classifier together in its pipeline
+        self.pipeline = getattr(model, 'pipeline', model)
+
+        if self.pipeline is None or not hasattr(self.pipeline, 'decision_function'):
+            raise ValueError(f'{self.model_path} does not hold a trained classifier with a decision function')
+
+        self.kept = 0
+        self.rejected = 0
+
+    def scores(self, results: list) -> list:
+        """
+        :param results: search results
+        :return: the classifier's decision function for each result, or None for results with no text
+        """
+        texts = [text_for(result) for result in results]
+        scored = [i for i, text in enumerate(texts) if text]
+
+        scores = [None] * len(results)
+
+        if scored:
+            for i, score in zip(scored, self.pipeline.decision_function([texts[i] for i in scored])):
+                scores[i] = float(score)
+
+        return scores
+
+    def screen(self, results: list, rejected=None) -> list:
+        """
+        :param results: search results
+        :param rejected: called as rejected(result, score) for every result that is screened out
+        :return: the results to download, highest scoring first, then those that couldn't be scored
+        """
+        scored, unscored = [], []
+
+        for result, score in zip(results, self.scores(results)):
+            if score is None:
+                unscored.append(result)
+            elif score >= self.threshold:
+                scored.append((score, result))
+            else:
+                self.rejected += 1
+
+                if rejected is not None:
+                    rejected(result, score)
+
+        # Stable, so results with equal scores stay in the order the search engine ranked them
+        scored.sort(key=lambda pair: -pair[0])
+
+        kept = [result for _, result in scored] + unscored
+        self.kept += len(kept)
+
+        return kept
+
+    def screen_iter(self, results, rejected=None):
+        """
+        :param results: iterator of search results, e.g. still being produced by a search
+        :param rejected: see screen
+        :return: generator of the results to download
+
+        Results are screened SCREEN_BATCH at a time, so they are only ordered by score within each batch.
+        """
+        results = iter(results)
+
+        while True:
+            batch = list(islice(results, SCREEN_BATCH))
+
+            if not batch:
+                return
+
+            yield from self.screen(batch, rejected)
@@ -6,8 +6,11 @@ import hashlib
 import argparse
 
 from .grab import download
+from .search_cache import SearchCache
+from .results import ResultsWriter, read_results, is_jsonl
 
 from pathlib import Path
+from itertools import chain
 from xml.etree import ElementTree as ET
 
 from serpapi.google_scholar_search_results import GoogleScholarSearchResults  # Google Scholar
@@ -20,15 +23,21 @@ import pybliometrics as pb  # Scopus
 import wos  # Web of Knowledge
 import pymed  # PubMed
 
+# Number of PubMed articles handed on at a time by PubMed.pages
+PUBMED_PAGE_SIZE = 100
 
-def query_and_run(source: str, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
+
+def query_and_run(source: str, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                  cache: SearchCache = None, refresh: bool = False):
     """
     :param source: search engine to query (google, wos, scopus, pubmed)
     :param label: a reference label for this query (e.g. brucellosis_sheep_nigeria)
     :param search_phrase: the actual search query. This should match the syntax of the source you are using!
     :param date_range: Restrict results to (start_year, end_year), e.g. (2012, 2018)
-    :param results_file: Name of the json file to save all results in
+    :param results_file: Name of the json file to save all results in. A '.jsonl' file is written a result at a time.
     :param max_results: Maximum number of results you want.
+    :param cache: SearchCache to take the results from if this query has been run recently, and to save them to
+    :param refresh: search again even if the cache has the results
     :return: Query object
 
     Returns the Query object, which is then passed to grab.GrabAll class to download the PDFs of the results.
@@ -43,7 +52,9 @@ def query_and_run(source: str, label: str, search_phrase: str, date_range: tuple
                          search_phrase=search_phrase,
                          date_range=date_range,
                          results_file=results_file,
-                         max_results=max_results)
+                         max_results=max_results,
+                         cache=cache,
+                         refresh=refresh)
 
     searcher.run()
 
@@ -51,7 +62,8 @@ def query_and_run(source: str, label: str, search_phrase: str, date_range: tuple
 
 
 class Query:
-    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
+    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                 cache: SearchCache = None, refresh: bool = False):
         self.label = label
 
         self.search_phrase = search_phrase
@@ -60,12 +72,19 @@ class Query:
 
         self.results_file = Path(results_file).expanduser()
 
+        # A JSON Lines results file is written as the results arrive rather than all at the end, see results.py
+        self.streaming = is_jsonl(self.results_file)
+
         self.max_results = max_results
 
         self.processed_results = None
 
         self.source = None
 
+        # Results are looked up here before searching and saved here afterwards, unless refresh is set
+        self.cache = cache
+        self.refresh = refresh
+
         self.data = {'metadata': {'source': self.source,
                                   'label': self.label,
                                   'search_phrase': self.search_phrase,
@@ -79,6 +98,16 @@ class Query:
     def search(self):
         raise NotImplementedError
 
+    def pages(self):
+        """
+        Yields the raw search results a page at a time, as the search engine returns them.
+        Engines that can't page just yield everything from search() at once.
+        """
+        results = self.search()
+
+        if results:
+            yield results
+
     def process_results(self, search_results):
         raise NotImplementedError
 
@@ -88,12 +117,55 @@ class Query:
         if self.results_file.parent.parts:
             self.results_file.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(self.results_file, 'w') as o:
-            json.dump(self.data, o, indent=5)
+        if self.streaming:
+            with ResultsWriter(self.results_file, self.data['metadata']) as writer:
+                for result in self.data['results'] or []:
+                    writer.write(result)
+        else:
+            with open(self.results_file, 'w') as o:
+                json.dump(self.data, o, indent=5)
 
         print(f"Done!")
 
+    def cached_results(self):
+        """
+        :return: this query's results from the cache, or None if the search has to be run
+        """
+        if self.cache is None or self.refresh:
+            return None
+
+        results = self.cache.get(self.source, self.data['metadata']['search_phrase'],
+                                 (self.start_date, self.end_date), self.max_results)
+
+        if results is not None:
+            print(f"Using {len(results)} cached {self.source} results for: {self.data['metadata']['search_phrase']}")
+
+        return results
+
+    def cache_results(self, results=None):
+        """
+        :param results: results to cache, as a list or an iterator such as read_results(). Defaults to self.data's.
+        """
+        results = results if results is not None else self.data['results']
+
+        if self.cache is not None and results:
+            self.cache.put(self.source, self.data['metadata']['search_phrase'],
+                           (self.start_date, self.end_date), self.max_results, results)
+
     def run(self):
+        if self.streaming:
+            # Each result goes straight to results_file, which is where download() reads them back from
+            for _ in self.iter_results():
+                pass
+            return
+
+        cached = self.cached_results()
+
+        if cached is not None:
+            self.data['results'] = cached
+            self.save_to_json()
+            return
+
         self.search_results = self.search()
 
         if self.search_results:
@@ -102,17 +174,83 @@ class Query:
             self.data['results'] = None
             print('No results found...')
 
+        self.cache_results()
+        self.save_to_json()
+
+    def iter_results(self):
+        """
+        Does the same as run(), but yields each processed result as soon as its page has been
+        fetched, so they can be downloaded while the search is still paging (see grab.download).
+        The JSON is saved once the search is finished.
+        """
+        cached = self.cached_results()
+
+        if cached is not None:
+            self.data['results'] = cached
+
+            yield from cached
+
+            self.save_to_json()
+            return
+
+        if self.streaming:
+            yield from self.stream_results()
+            return
+
+        self.data['results'] = []
+
+        for page in self.pages():
+            for result in self.process_results(page):
+                self.data['results'].append(result)
+
+                yield result
+
+        if not self.data['results']:
+            self.data['results'] = None
+            print('No results found...')
+
+        self.cache_results()
         self.save_to_json()
 
+    def stream_results(self):
+        """
+        iter_results for a JSON Lines results_file: each result is appended to the file as soon as it
+        has been processed, and isn't kept in self.data.
+        """
+        print(f"Saving results to: {self.results_file}")
+
+        with ResultsWriter(self.results_file, self.data['metadata']) as writer:
+            for page in self.pages():
+                for result in self.process_results(page):
+                    writer.write(result)
+
+                    yield result
+
+        if not writer.count:
+            print('No results found...')
+        elif self.cache is not None:
+            self.cache_results(read_results(self.results_file))
+
+        print("Done!")
+
 
 class GoogleScholar(Query):
-    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
-        super().__init__(label, search_phrase, date_range, results_file, max_results)
+    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                 cache: SearchCache = None, refresh: bool = False):
+        super().__init__(label, search_phrase, date_range, results_file, max_results, cache, refresh)
 
         self.source = 'Google_Scholar'
         self.data['metadata']['source'] = 'Google_Scholar'
 
     def search(self):
+        pages = list(self.pages())
+
+        if not pages:
+            return
+
+        return list(chain.from_iterable(pages))
+
+    def pages(self):
         params = {"q": self.search_phrase,
                   "hl": "en"
                   }
@@ -133,43 +271,45 @@ class GoogleScholar(Query):
         else:
             new_max = self.max_results
 
-        all_results = [i for i in results['organic_results']]
+        page = [self.add_url(i) for i in results['organic_results']]
+        count = len(page)
 
-        for i in all_results:
-            if i.get('link', None):
-                i['url'] = i['link']
-                i['saved_pdf_name'] = hashlib.md5(i['link'].encode()).hexdigest() + '.pdf'
-            else:
-                i['url'] = "http://none"
-                i['saved_pdf_name'] = hashlib.md5(i['title'].encode()).hexdigest() + '.pdf'
+        yield page
 
         if results['search_information']['total_results'] <= self.max_results:
-            return all_results
+            return
 
-        while len(all_results) < new_max:
+        while count < new_max:
             if results.get('serpapi_pagination'):
                 pass
             else:
-                return all_results
+                return
 
             results = requests.get(results['serpapi_pagination']['next_link'])
 
             results = json.loads(results.content)
 
-            for i in results['organic_results']:
-                if i.get('link', None):
-                    i['url'] = i['link']
-                    i['saved_pdf_name'] = hashlib.md5(i['link'].encode()).hexdigest() + '.pdf'
-                else:
-                    i['url'] = "http://none"
-                    i['saved_pdf_name'] = hashlib.md5(i['title'].encode()).hexdigest() + '.pdf'
+            page = []
 
-                all_results.append(i)
+            for i in results['organic_results']:
+                page.append(self.add_url(i))
+                count += 1
 
-                if len(all_results) == new_max:
+                if count == new_max:
                     break
 
-        return all_results
+            yield page
+
+    @staticmethod
+    def add_url(result: dict) -> dict:
+        if result.get('link', None):
+            result['url'] = result['link']
+            result['saved_pdf_name'] = hashlib.md5(result['link'].encode()).hexdigest() + '.pdf'
+        else:
+            result['url'] = "http://none"
+            result['saved_pdf_name'] = hashlib.md5(result['title'].encode()).hexdigest() + '.pdf'
+
+        return result
 
     def process_results(self, search_results):
 
@@ -181,8 +321,9 @@ class GoogleScholar(Query):
 
 
 class WoS(Query):
-    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
-        super().__init__(label, search_phrase, date_range, results_file, max_results)
+    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                 cache: SearchCache = None, refresh: bool = False):
+        super().__init__(label, search_phrase, date_range, results_file, max_results, cache, refresh)
         self.original_search_phrase = search_phrase
 
         self.start_date = date_range[0]
@@ -197,6 +338,19 @@ class WoS(Query):
         self.data['metadata']['source'] = 'WoS'
 
     def run(self):
+        if self.streaming:
+            # Each result goes straight to results_file, which is where download() reads them back from
+            for _ in self.iter_results():
+                pass
+            return
+
+        cached = self.cached_results()
+
+        if cached is not None:
+            self.data['results'] = cached
+            self.save_to_json()
+            return
+
         self.search_results = self.search()
 
         if self.search_results:
@@ -204,9 +358,13 @@ class WoS(Query):
         else:
             print('No results found...')
 
+        self.cache_results()
         self.save_to_json()
 
     def search(self):
+        return list(chain.from_iterable(self.pages()))
+
+    def pages(self):
         client = wos.WosClient(lite=True)
 
         offset = 1
@@ -216,7 +374,7 @@ class WoS(Query):
         if self.max_results < count:
             count = self.max_results
 
-        all_results = []
+        total = 0
 
         with client as c:
             result = wos.utils.query(c, self.search_phrase, count=count, offset=offset)
@@ -227,18 +385,17 @@ class WoS(Query):
 
             print(f"Total matches found: {max_total}")
 
-            for r in tree.findall('.//records'):
-                if len(all_results) == self.max_results:
-                    break
-                else:
-                    all_results.append(r)
+            page = tree.findall('.//records')[:self.max_results]
+            total += len(page)
+
+            yield page
 
             loops = round(max_total / count)
 
             if loops in {0, 1}:
                 # We only needed one loop, so have got all we can, so return it.
-                print(f'\tTotal papers grabbed: {len(all_results)}')
-                return all_results
+                print(f'\tTotal papers grabbed: {total}')
+                return
 
             for loop in range(loops - 1):
                 offset = offset + 1 + count
@@ -247,13 +404,17 @@ class WoS(Query):
 
                 tree = ET.fromstring(result)
 
+                page = []
+
                 for r in tree.findall('.//records'):
-                    all_results.append(r)
+                    page.append(r)
+                    total += 1
 
-                    if len(all_results) == self.max_results:
-                        return all_results
+                    if total == self.max_results:
+                        yield page
+                        return
 
-            return all_results
+                yield page
 
     def process_results(self, results):
         all_dicts = []
@@ -308,8 +469,9 @@ class WoS(Query):
 
 
 class Scopus(Query):
-    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
-        super().__init__(label, search_phrase, date_range, results_file, max_results)
+    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                 cache: SearchCache = None, refresh: bool = False):
+        super().__init__(label, search_phrase, date_range, results_file, max_results, cache, refresh)
         self.original_search_phrase = search_phrase
         self.search_phrase = f"TITLE-ABS-KEY({search_phrase})"
 
@@ -358,14 +520,18 @@ class Scopus(Query):
 
 
 class PubMed(Query):
-    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int):
-        super().__init__(label, search_phrase, date_range, results_file, max_results)
+    def __init__(self, label: str, search_phrase: str, date_range: tuple, results_file: str, max_results: int,
+                 cache: SearchCache = None, refresh: bool = False):
+        super().__init__(label, search_phrase, date_range, results_file, max_results, cache, refresh)
         self.search_phrase = search_phrase
 
         self.source = 'PubMed'
         self.data['metadata']['source'] = 'PubMed'
 
     def search(self):
+        return list(chain.from_iterable(self.pages()))
+
+    def pages(self):
         pubmed = pymed.PubMed(tool='SEBI', email='alexander.robertson@ed.ac.uk')
 
         if all([self.start_date, self.end_date]):
@@ -375,7 +541,18 @@ class PubMed(Query):
         else:
             results = pubmed.query(self.search_phrase, max_results=self.max_results)
 
-        return [r.toDict() for r in results]
+        # pymed fetches the articles in batches as they are iterated over, so pass them on in batches too
+        page = []
+
+        for r in results:
+            page.append(r.toDict())
+
+            if len(page) == PUBMED_PAGE_SIZE:
+                yield page
+                page = []
+
+        if page:
+            yield page
 
     def process_results(self, results):
         all_dicts = []
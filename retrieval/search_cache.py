@@ -0,0 +1,127 @@
+"""
+Persistent cache of search results used by search.Query.run and search.Query.iter_results.
+
+Repeating a query (another download attempt, a re-run of a batch) otherwise spends SerpApi
+credits, Web of Science minutes and Scopus quota on results we already have. Processed results
+are stored in a SQLite database, keyed by the engine, the search phrase with its whitespace
+normalised, and the date range. Each entry remembers the max_results it was searched with, so
+a later query asking for the same or fewer results is served from it, the first max_results of
+them in the engine's order. A search that returned fewer results than it asked for found
+everything there is, so it serves a query of any size.
+"""
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+from pathlib import Path
+
+DEFAULT_PATH = '~/.cache/sebi/search_cache.sqlite'
+
+DAY = 24 * 60 * 60
+
+
+def normalise_phrase(search_phrase: str) -> str:
+    """
+    :param search_phrase: query as given to the search engine
+    :return: the query with runs of whitespace collapsed. Case is kept, as engines treat AND/OR/NOT differently
+             from and/or/not.
+    """
+    return ' '.join(search_phrase.split())
+
+
+def query_key(source: str, search_phrase: str, date_range) -> str:
+    start, end = date_range if date_range else (None, None)
+
+    return json.dumps([source, normalise_phrase(search_phrase), str(start), str(end)])
+
+
+class SearchCache:
+    def __init__(self, path: str = DEFAULT_PATH, ttl: float = 7 * DAY):
+        """
+        :param path: location of the SQLite database. Created if it doesn't exist.
+        :param ttl: seconds a query's results stay valid. New papers keep being indexed, so not too long.
+        """
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS searches ('
+                         'key TEXT NOT NULL, '
+                         'max_results INTEGER NOT NULL, '
+                         'complete INTEGER NOT NULL, '
+                         'results BLOB NOT NULL, '
+                         'fetched REAL NOT NULL, '
+                         'PRIMARY KEY (key, max_results))')
+        self._db.commit()
+
+    def get(self, source: str, search_phrase: str, date_range, max_results: int):
+        """
+        :param source: the Query's source, e.g. 'PubMed'
+        :param search_phrase: the query as the user gave it
+        :param date_range: (start_year, end_year), either of which may be None
+        :param max_results: number of results wanted
+        :return: the first max_results cached results, or None on a miss
+        """
+        with self._lock:
+            row = self._db.execute('SELECT results FROM searches '
+                                   'WHERE key = ? AND (max_results >= ? OR complete) AND fetched > ? '
+                                   'ORDER BY fetched DESC LIMIT 1',
+                                   (query_key(source, search_phrase, date_range), max_results,
+                                    time.time() - self.ttl)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return json.loads(zlib.decompress(row[0]).decode())[:max_results]
+
+    def put(self, source: str, search_phrase: str, date_range, max_results: int, results):
+        """
+        :param results: the processed results of searching with max_results, in the engine's order. Can be an
+                        iterator, e.g. results.read_results() of a JSON Lines file, which is encoded a result at a
+                        time rather than all held in memory.
+        :return: None
+        """
+        compressor = zlib.compressobj()
+        blob, count = [compressor.compress(b'[')], 0
+
+        for result in results:
+            blob.append(compressor.compress((b',' if count else b'') + json.dumps(result).encode()))
+            count += 1
+
+        blob.append(compressor.compress(b']') + compressor.flush())
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO searches (key, max_results, complete, results, fetched) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (query_key(source, search_phrase, date_range), max_results,
+                              int(count < max_results), b''.join(blob),
+                              time.time()))
+            self._db.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute('DELETE FROM searches WHERE fetched < ?', (time.time() - self.ttl,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,124 @@
+"""
+Content-addressed PDF store shared by every label, engine and pdf_folder.
+
+The same paper turns up under many queries, and used to be downloaded and saved again
+for each of them (named by DOI for most engines and by an MD5 of the link for Google
+Scholar). Instead, each PDF is kept once under its SHA-256 and hard-linked (or
+symlinked, where hard links aren't possible) into every output folder that wants it.
+A small SQLite index maps DOIs and URLs to hashes, so GrabOne can find a paper in the
+store before resolving or downloading anything.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+
+from pathlib import Path
+
+from .doi_cache import normalise_doi
+
+
+def keys_for(*urls) -> list:
+    """
+    :param urls: any mix of dx.doi.org URLs and ordinary URLs. Empty and 'http://none' ones are ignored.
+    :return: index keys for the URLs, e.g. ['doi:10.1186/s12917-019-1', 'url:https://...']
+    """
+    keys = []
+
+    for url in urls:
+        if not url or url.lower() in {'http://none', 'http://dx.doi.org/none'}:
+            continue
+
+        if 'dx.doi.org/' in url:
+            key = 'doi:' + normalise_doi(url)
+        else:
+            key = 'url:' + url
+
+        if key not in keys:
+            keys.append(key)
+
+    return keys
+
+
+class PDFStore:
+    def __init__(self, root: str):
+        """
+        :param root: folder holding the blobs and their index. Created if it doesn't exist.
+        """
+        self.root = Path(root).expanduser()
+        (self.root / 'blobs').mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / 'index.sqlite'), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+        self._db.commit()
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / 'blobs' / sha256[:2] / f'{sha256}.pdf'
+
+    def lookup(self, keys: list):
+        """
+        :param keys: index keys from keys_for
+        :return: the SHA-256 of a stored PDF matching any of the keys, or None
+        """
+        with self._lock:
+            for key in keys:
+                row = self._db.execute('SELECT sha256 FROM keys WHERE key = ?', (key,)).fetchone()
+
+                if row is not None and self.blob_path(row[0]).is_file():
+                    return row[0]
+
+        return None
+
+    def add(self, pdf_path: str, sha256: str, keys: list) -> Path:
+        """
+        :param pdf_path: a freshly downloaded PDF. It is moved into the store (or deleted, if the store
+                         already has the same content).
+        :param sha256: hex SHA-256 of the file's content
+        :param keys: index keys the PDF should be found under in future
+        :return: path of the stored blob
+        """
+        blob = self.blob_path(sha256)
+        blob.parent.mkdir(exist_ok=True)
+
+        if blob.is_file():
+            os.remove(pdf_path)
+        else:
+            os.replace(pdf_path, blob)
+
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO keys (key, sha256) VALUES (?, ?)',
+                                 [(key, sha256) for key in keys])
+            self._db.commit()
+
+        return blob
+
+    def place(self, sha256: str, dest: str):
+        """
+        :param sha256: hash of a stored PDF
+        :param dest: where the PDF should appear, e.g. '<pdf_folder>/<saved_pdf_name>'
+        :return: None
+
+        Hard-links the blob to dest, falling back to a symlink across file systems and to a copy
+        if neither is allowed. dest is replaced atomically.
+        """
+        blob = self.blob_path(sha256)
+        tmp_path = f'{dest}.link'
+
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            try:
+                os.symlink(blob.resolve(), tmp_path)
+            except OSError:
+                shutil.copyfile(blob, tmp_path)
+
+        os.replace(tmp_path, dest)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
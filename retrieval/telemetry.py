@@ -0,0 +1,195 @@
+"""
+Download metrics for a GrabAll run: how long DOI resolution, landing pages and PDF fetches take
+per host, how many bytes each host sent, and how many results each grabber class saved or failed.
+
+GrabAll writes them to '<pdf_folder>/logs/telemetry_<label>.json' and, in Prometheus text
+format, to '<pdf_folder>/logs/telemetry_<label>.prom' at the end of the run, and shows a short
+summary in its progress bar while it runs.
+"""
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+
+from . import web
+
+# Stages that are timed
+RESOLVE = 'resolve'    # following the dx.doi.org redirect
+LANDING = 'landing'    # fetching the landing page
+PDF = 'pdf'            # fetching and saving the PDF
+
+# Upper bounds (seconds) of the latency histogram buckets, as in Prometheus
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# Outcome recorded for a saved result; failures are recorded under their ledger reason code
+OK = 'ok'
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """
+        :return: number of observations at or below each bucket's bound
+        """
+        total, cumulative = 0, []
+
+        for n in self.counts:
+            total += n
+            cumulative.append(total)
+
+        return cumulative
+
+    def to_dict(self) -> dict:
+        return {'count': self.count,
+                'sum': round(self.sum, 4),
+                'mean': round(self.sum / self.count, 4) if self.count else 0.0,
+                'buckets': {_bound(b): n for b, n in zip(BUCKETS, self.cumulative())}}
+
+
+def _bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else str(bound)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class Telemetry:
+    def __init__(self):
+        self.started = time.time()
+
+        # (stage, host) -> Histogram
+        self.latency = {}
+
+        # host -> bytes received
+        self.bytes = {}
+
+        # (grabber class name, host, outcome) -> count
+        self.results = {}
+
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, url: str, seconds: float):
+        """
+        :param stage: RESOLVE, LANDING or PDF
+        :param url: URL that was fetched
+        :param seconds: how long it took
+        """
+        key = (stage, web.host_of(url))
+
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram()
+
+            self.latency[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, url: str):
+        """
+        Times the body of a with block, whether or not it raises.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, url, time.perf_counter() - start)
+
+    def add_bytes(self, url: str, n: int):
+        if not n:
+            return
+
+        host = web.host_of(url)
+
+        with self._lock:
+            self.bytes[host] = self.bytes.get(host, 0) + n
+
+    def outcome(self, grabber: str, url: str, outcome: str):
+        """
+        :param grabber: name of the grabber class that handled the result
+        :param url: the result's landing page (or PDF) URL
+        :param outcome: OK, or the ledger reason code of the failure
+        """
+        key = (grabber, web.host_of(url), outcome)
+
+        with self._lock:
+            self.results[key] = self.results.get(key, 0) + 1
+
+    def postfix(self) -> dict:
+        """
+        :return: a few headline numbers for tqdm's set_postfix
+        """
+        with self._lock:
+            ok = sum(n for (_, _, outcome), n in self.results.items() if outcome == OK)
+            failed = sum(self.results.values()) - ok
+            mb = sum(self.bytes.values()) / 1024 / 1024
+
+        return {'ok': ok, 'failed': failed, 'MB': f'{mb:.1f}', 'MB/s': f'{mb / max(time.time() - self.started, 1e-9):.2f}'}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            grabbers = {}
+            for (grabber, host, outcome), n in sorted(self.results.items()):
+                counts = grabbers.setdefault(grabber, {}).setdefault(host, {})
+                counts[outcome] = n
+
+            latency = {}
+            for (stage, host), histogram in sorted(self.latency.items()):
+                latency.setdefault(stage, {})[host] = histogram.to_dict()
+
+            return {'seconds': round(time.time() - self.started, 3),
+                    'results': grabbers,
+                    'bytes': dict(sorted(self.bytes.items())),
+                    'latency': latency}
+
+    def to_prometheus(self) -> str:
+        lines = ['# HELP sebi_grab_duration_seconds Time taken by each download stage.',
+                 '# TYPE sebi_grab_duration_seconds histogram']
+
+        with self._lock:
+            for (stage, host), histogram in sorted(self.latency.items()):
+                for bound, n in zip(BUCKETS, histogram.cumulative()):
+                    lines.append(f'sebi_grab_duration_seconds_bucket{_labels(stage=stage, host=host, le=_bound(bound))} {n}')
+
+                lines.append(f'sebi_grab_duration_seconds_sum{_labels(stage=stage, host=host)} {histogram.sum}')
+                lines.append(f'sebi_grab_duration_seconds_count{_labels(stage=stage, host=host)} {histogram.count}')
+
+            lines += ['# HELP sebi_grab_bytes_total Bytes of landing pages and PDFs received.',
+                      '# TYPE sebi_grab_bytes_total counter']
+            lines += [f'sebi_grab_bytes_total{_labels(host=host)} {n}' for host, n in sorted(self.bytes.items())]
+
+            lines += ['# HELP sebi_grab_results_total Results handled, by grabber class, host and outcome.',
+                      '# TYPE sebi_grab_results_total counter']
+            lines += [f'sebi_grab_results_total{_labels(grabber=grabber, host=host, outcome=outcome)} {n}'
+                      for (grabber, host, outcome), n in sorted(self.results.items())]
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path_stem: str):
+        """
+        :param path_stem: path without extension; '.json' and '.prom' files are written
+        :return: None
+        """
+        with open(f'{path_stem}.json', 'w') as f:
+            json.dump(self.to_dict(), f, indent=5)
+
+        with open(f'{path_stem}.prom', 'w') as f:
+            f.write(self.to_prometheus())
@@ -0,0 +1,543 @@
+"""
+Shared plumbing for every HTTP request made while grabbing PDFs.
+
+All requests from grab.py go through get(), which sends them on one pooled
+requests.Session so that TCP/TLS connections are kept alive and reused between
+results, and holds a slot for the target host while the request runs. Redirects are
+followed one hop at a time, each holding a slot for its own host (and counting towards
+its own host's rate limit and circuit breaker, below), and a hop's slot is given back
+before the next hop is sent: a DOI's resolver slot is freed as soon as dx.doi.org
+answers, and the publisher's slot is held while its page or PDF is read. This lets
+GrabAll run many downloads at once without sending more than HOST_LIMITS.per_host
+simultaneous requests to any single publisher.
+
+On top of that, RATE_LIMITS paces requests to each host with a token bucket that slows
+down when the host answers 429/503 (honouring Retry-After) and speeds back up while it
+keeps answering normally. Connection errors, timeouts and those "busy" statuses are
+retried a few times with exponential backoff before get() gives up.
+
+Finally, BREAKERS stops wasting time on hosts that are down or blocking us: after
+BREAKER_THRESHOLD requests in a row fail, get() raises HostUnavailable for that host
+straight away until BREAKER_COOLDOWN has passed, then lets a single probe through.
+"""
+import time
+import random
+import threading
+import requests
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urljoin
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from requests.utils import requote_uri
+
+# Many sites won't allow access without a properly specified User-Agent in the header
+USER_AGENT = 'Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.1.5) Gecko/20091123 Iceweasel/3.5.5 (like ' \
+             'Firefox/3.5.5; Debian-3.5.5-1) '
+
+# (connect, read) timeout in seconds applied to every request unless the caller overrides it
+TIMEOUT = (10, 10)
+
+# Number of distinct hosts to keep connection pools open for
+POOL_HOSTS = 100
+
+# How many times a request is retried after a connection error, timeout or RETRY_STATUSES response
+RETRIES = 3
+
+# Statuses that mean "try again later" rather than "no"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Exponential backoff between retries: BACKOFF_BASE * 2**attempt seconds (with jitter), at most BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Retry-After values longer than this are not waited for: the request just fails, and the host is left to its
+# circuit breaker rather than paused for that long
+MAX_RETRY_AFTER = 120.0
+
+# Consecutive failed requests after which a host's circuit opens, and seconds before it is probed again
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 300.0
+
+
+class HostUnavailable(requests.ConnectionError):
+    """
+    Raised instead of sending a request to a host whose circuit breaker is open.
+    """
+
+
+class SlotTimeout(requests.Timeout):
+    """
+    Raised when no slot for the host comes free before the caller's deadline. Nothing was sent, so it says
+    nothing about the host and isn't held against it.
+    """
+
+
+def host_of(url: str) -> str:
+    """
+    :param url: any URL
+    :return: the lower-cased hostname of the URL, or '' if it has none
+    """
+    return (urlsplit(url).hostname or '').lower()
+
+
+class HostLimiter:
+    """
+    Caps the number of requests that may be in flight to one host at the same time.
+    """
+    def __init__(self, per_host: int = 2):
+        self.per_host = per_host
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, per_host: int):
+        with self._lock:
+            self.per_host = per_host
+            self._slots = {}
+
+    def _semaphore(self, host: str):
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+
+            return self._slots[host]
+
+    def _acquire(self, url: str, deadline: float = None):
+        host = host_of(url)
+        semaphore = self._semaphore(host)
+
+        if not semaphore.acquire(timeout=None if deadline is None else max(0.0, deadline - time.monotonic())):
+            raise SlotTimeout(f'No free slot for {host} before the deadline')
+
+        return semaphore
+
+    @contextmanager
+    def slot(self, url: str, deadline: float = None):
+        """
+        :param url: URL about to be requested
+        :param deadline: time.monotonic() to wait for a slot until, or None to wait as long as it takes.
+                         Raises SlotTimeout when it passes.
+        """
+        semaphore = self._acquire(url, deadline)
+
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def acquire(self, url: str, deadline: float = None):
+        """
+        :param url: URL about to be requested
+        :param deadline: see slot
+        :return: a function that gives the slot back. Calling it more than once is harmless.
+        """
+        semaphore = self._acquire(url, deadline)
+
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                semaphore.release()
+
+        return release
+
+
+HOST_LIMITS = HostLimiter()
+
+
+class TokenBucket:
+    """
+    Lets requests through at `rate` per second on average, with bursts of up to `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self, deadline: float = None):
+        """
+        :param deadline: time.monotonic() by which the caller has to be done, or None for no limit.
+                         Raises requests.Timeout rather than waiting past it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    delay = (1 - self.tokens) / self.rate
+
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise requests.Timeout(f'Rate limited for {delay:.1f}s, past the deadline')
+
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """
+    One TokenBucket per host, adjusted additive-increase/multiplicative-decrease style: each normal
+    response nudges the host's rate up towards max_rate, each 429/503 halves it (down to min_rate)
+    and a Retry-After header pauses the host entirely for that long.
+    """
+    def __init__(self, rate: float = 2.0, max_rate: float = 10.0, min_rate: float = 0.05, increase: float = 0.1):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float = None, max_rate: float = None):
+        with self._lock:
+            self.rate = rate or self.rate
+            self.max_rate = max(max_rate or self.max_rate, self.rate)
+            self._buckets = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = host_of(url)
+
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, capacity=max(1.0, self.rate))
+
+            return self._buckets[host]
+
+    def wait(self, url: str, deadline: float = None):
+        self.bucket(url).wait(deadline)
+
+    def success(self, url: str):
+        bucket = self.bucket(url)
+
+        with bucket.lock:
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def throttle(self, url: str, retry_after: float = None):
+        """
+        :param url: URL whose host answered 429/503
+        :param retry_after: seconds the host asked us to wait, if it said. Longer than MAX_RETRY_AFTER is ignored,
+                            so one long Retry-After doesn't stall every later request to the host.
+        :return: True if the host was paused for retry_after
+        """
+        bucket = self.bucket(url)
+
+        with bucket.lock:
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.tokens = 0
+
+            if retry_after and retry_after <= MAX_RETRY_AFTER:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+                return True
+
+        return False
+
+
+RATE_LIMITS = RateLimiter()
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    closed:    requests go through; consecutive failures are counted
+    open:      requests fail immediately with HostUnavailable until the cooldown has passed
+    half-open: one probe request is let through; success closes the circuit, failure re-opens it
+    """
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        # host -> [consecutive failures, time the circuit opened (or None), probe in flight]
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, threshold: int = None, cooldown: float = None):
+        with self._lock:
+            self.threshold = threshold or self.threshold
+            self.cooldown = cooldown or self.cooldown
+            self._hosts = {}
+
+    def check(self, url: str):
+        """
+        :param url: URL about to be requested
+        :return: None. Raises HostUnavailable if the host's circuit is open.
+        """
+        host = host_of(url)
+
+        with self._lock:
+            failures, opened, probing = self._hosts.get(host, (0, None, False))
+
+            if opened is None:
+                return
+
+            if probing or time.monotonic() - opened < self.cooldown:
+                raise HostUnavailable(f'{host} is unavailable after {failures} consecutive failures')
+
+            self._hosts[host] = [failures, opened, True]
+
+    def success(self, url: str):
+        with self._lock:
+            self._hosts.pop(host_of(url), None)
+
+    def release(self, url: str):
+        """
+        Gives up a probe that ended without the host answering either way, e.g. because the caller's deadline
+        passed first, so the next request after the cooldown can probe instead.
+        """
+        host = host_of(url)
+
+        with self._lock:
+            if host in self._hosts:
+                self._hosts[host][2] = False
+
+    def failure(self, url: str):
+        host = host_of(url)
+
+        with self._lock:
+            failures, opened, probing = self._hosts.get(host, (0, None, False))
+            failures += 1
+
+            if probing or failures >= self.threshold:
+                opened = time.monotonic()
+
+            self._hosts[host] = [failures, opened, False]
+
+    def is_open(self, url: str) -> bool:
+        with self._lock:
+            return self._hosts.get(host_of(url), (0, None, False))[1] is not None
+
+
+BREAKERS = CircuitBreaker()
+
+
+def retry_after(r) -> float:
+    """
+    :param r: requests.Response
+    :return: seconds asked for by the Retry-After header (either delay-seconds or an HTTP date), or None
+    """
+    value = r.headers.get('retry-after')
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """
+    :param attempt: 0 for the first retry, 1 for the second, ...
+    :return: seconds to wait, with full jitter so that workers don't retry in lockstep
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def make_session(per_host: int = 2):
+    """
+    :param per_host: number of keep-alive connections to hold open for each host
+    :return: requests.Session with pooled adapters and the shared User-Agent
+    """
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=per_host)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+SESSION = make_session(HOST_LIMITS.per_host)
+
+# Arguments of the last configure call
+_settings = None
+
+
+def configure(per_host: int = 2, rate: float = None, max_rate: float = None):
+    """
+    :param per_host: maximum number of simultaneous requests (and pooled connections) per host
+    :param rate: requests per second each host starts out allowed. None keeps the current setting.
+    :param max_rate: fastest any host will be allowed to go. None keeps the current setting.
+    :return: None
+
+    Resizes the per-host limits and rebuilds the shared session to match. Calling it again with the
+    same settings changes nothing, so downloads running side by side (e.g. the batch scheduler's)
+    don't reset each other's limits or close the session under each other.
+    """
+    global SESSION, _settings
+
+    if (per_host, rate, max_rate) == _settings:
+        return
+
+    _settings = (per_host, rate, max_rate)
+
+    HOST_LIMITS.set_limit(per_host)
+    RATE_LIMITS.configure(rate=rate, max_rate=max_rate)
+    BREAKERS.configure()
+
+    old_session, SESSION = SESSION, make_session(per_host)
+    old_session.close()
+
+
+def get(url: str, **kwargs):
+    """
+    :param url: URL to request
+    :param kwargs: passed straight on to requests.Session.get, except for deadline: time.monotonic() by which
+                   the caller has to be done, or None. Waits for a host slot, for the rate limit and between
+                   retries stop there.
+    :return: requests.Response
+
+    Drop-in replacement for requests.get that reuses pooled connections, sends the shared
+    User-Agent, applies TIMEOUT unless one is given, respects the per-host concurrency cap and
+    rate limit, and retries transient failures. If the host is still busy after RETRIES retries
+    the last response is returned as it is; if it still can't be reached the exception is raised.
+    Raises HostUnavailable without sending anything while the host's circuit breaker is open.
+
+    Redirects (unless allow_redirects=False) are followed one hop at a time, and each hop is
+    limited, retried and counted towards the breaker of its own host. A publisher that times out
+    or answers 503 after dx.doi.org redirected to it is held against the publisher, not dx.doi.org.
+
+    With stream=True the body is read after this returns, so the host's slot is only given
+    back when the response is closed. Always close streamed responses (or use them in a with block).
+    """
+    kwargs.setdefault('timeout', TIMEOUT)
+
+    deadline = kwargs.pop('deadline', None)
+    follow = kwargs.pop('allow_redirects', True)
+    history = []
+
+    while True:
+        r = _request(url, deadline, allow_redirects=False, **kwargs)
+
+        if not (follow and r.is_redirect):
+            break
+
+        if len(history) >= SESSION.max_redirects:
+            r.close()
+            raise requests.TooManyRedirects(f'Exceeded {SESSION.max_redirects} redirects', response=r)
+
+        try:
+            # Reading the (usually empty) body lets the connection go back to the pool
+            r.content
+        except (requests.RequestException, RuntimeError):
+            pass
+        finally:
+            r.close()
+
+        history.append(r)
+        url = requote_uri(urljoin(r.url, SESSION.get_redirect_target(r)))
+
+    if history:
+        r.history = history
+
+    return r
+
+
+def _request(url: str, deadline: float = None, **kwargs):
+    """
+    :param url: URL of one hop
+    :param deadline: see get
+    :param kwargs: see get
+    :return: requests.Response
+
+    Sends one hop through the host's breaker and rate limit, retrying it if it fails transiently.
+    """
+    BREAKERS.check(url)
+
+    # Whether the breaker has been told how the host did. Every way out must tell it, or release a
+    # half-open probe, otherwise the host stays unavailable for the rest of the run.
+    settled = False
+
+    try:
+        for attempt in range(RETRIES + 1):
+            RATE_LIMITS.wait(url, deadline)
+
+            try:
+                r = _send(url, deadline, **kwargs)
+            except SlotTimeout:
+                raise
+            except (requests.ConnectionError, requests.Timeout):
+                delay = backoff(attempt)
+
+                if attempt == RETRIES or (deadline is not None and time.monotonic() + delay > deadline):
+                    BREAKERS.failure(url)
+                    settled = True
+                    raise
+
+                time.sleep(delay)
+                continue
+            except Exception:
+                BREAKERS.failure(url)
+                settled = True
+                raise
+
+            if r.status_code not in RETRY_STATUSES:
+                RATE_LIMITS.success(url)
+                BREAKERS.success(url)
+                settled = True
+                return r
+
+            wait = retry_after(r)
+            blocked = r.status_code in {429, 503} and RATE_LIMITS.throttle(url, wait)
+
+            # Waits out Retry-After (even on a 500/502/504), otherwise backs off
+            delay = wait or backoff(attempt)
+
+            if attempt == RETRIES or (wait or 0) > MAX_RETRY_AFTER or \
+                    (deadline is not None and time.monotonic() + delay > deadline):
+                BREAKERS.failure(url)
+                settled = True
+                return r
+
+            r.close()
+
+            # Once throttle has paused the host, its token bucket does the waiting
+            time.sleep(0 if blocked else delay)
+    finally:
+        if not settled:
+            # e.g. the rate limit would have run past the deadline, so the host was never asked
+            BREAKERS.release(url)
+
+
+def _send(url: str, deadline: float = None, **kwargs):
+    if not kwargs.get('stream'):
+        with HOST_LIMITS.slot(url, deadline):
+            return SESSION.get(url, **kwargs)
+
+    release = HOST_LIMITS.acquire(url, deadline)
+
+    try:
+        r = SESSION.get(url, **kwargs)
+    except Exception:
+        release()
+        raise
+
+    close = r.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    r.close = close_and_release
+
+    return r
@@ -1,29 +1,35 @@
-import time
-import datetime
-
 import argparse
 import retrieval
 
 import pandas as pd
 
 
-def do_query(engine, json_file, max_results, label, year_range, query, pdf_folder):
+def do_query(engine, json_file, max_results, label, year_range, query, pdf_folder, workers=1, per_host=2, doi_cache=None,
+             max_pdf_size=retrieval.grab.MAX_PDF_SIZE, resume=True, pdf_store=None, host_rate=None, pipeline=False,
+             item_deadline=retrieval.grab.ITEM_DEADLINE, domain_stats=None, skip_hosts=False, screen_model=None,
+             screen_threshold=0.0, search_cache=None, refresh_search=False):
 
     searcher = engine(label=label,
                       search_phrase=query,
                       date_range=year_range,
                       results_file=json_file,
-                      max_results=max_results)
+                      max_results=max_results,
+                      cache=search_cache,
+                      refresh=refresh_search)
 
-    searcher.run()
+    if not pipeline:
+        searcher.run()
 
-    retrieval.grab.download(searcher, pdf_folder)
+    retrieval.grab.download(searcher, pdf_folder, workers=workers, per_host=per_host, doi_cache=doi_cache,
+                            max_pdf_size=max_pdf_size, resume=resume, pdf_store=pdf_store, host_rate=host_rate,
+                            pipeline=pipeline, item_deadline=item_deadline, domain_stats=domain_stats,
+                            skip_hosts=skip_hosts, screen_model=screen_model, screen_threshold=screen_threshold)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('-mode', required=True, type=str, choices=['single', 'batch'], help='Submit single specified query, or use a CSV file of queries.')
+    parser.add_argument('-mode', required=True, type=str, choices=['single', 'batch', 'retry', 'download', 'dedup'], help='Submit single specified query, use a CSV file of queries, retry the failures in a ledger, download the results of earlier searches, or merge the duplicates across earlier searches into one results file.')
 
     parser.add_argument('-csv_file', type=str, help="CSV of queries, one per line. Columns should be {'engine', 'json_file', 'max_results', 'label', 'start_year', 'end_year', 'query', 'pdf_folder'}")
 
@@ -35,10 +41,45 @@ if __name__ == '__main__':
     parser.add_argument('-query', type=str, help='Search terms to use')
     parser.add_argument('-start_year', type=int, default=2015, help='Limit results to papers after this year, inclusive. Format: YYYY')
     parser.add_argument('-end_year', type=int, default=2020, help='Limit results to papers before this year, inclusive. Format: YYYY')
+    parser.add_argument('-workers', type=int, default=1, help='Number of PDFs to download at the same time')
+    parser.add_argument('-per_host', type=int, default=2, help='Max simultaneous requests to any one host when downloading')
+    parser.add_argument('-doi_cache', type=str, default=retrieval.doi_cache.DEFAULT_PATH, help="SQLite file caching DOI -> URL resolutions between runs. Pass '' to disable")
+    parser.add_argument('-domain_stats', type=str, default=retrieval.domain_stats.DEFAULT_PATH, help="SQLite file recording which PDF URLs work on each host, used to try the likeliest first. Pass '' to disable, or delete the file to forget what it has learnt")
+    parser.add_argument('-skip_hosts', action='store_true', help='With -domain_stats, skip results on hosts that have recently given a PDF for fewer than 5%% of at least 10 attempts')
+    parser.add_argument('-screen_model', type=str, help='Pickled classifier (from classify.py -t) to screen titles and abstracts with; only results it scores highly enough are downloaded')
+    parser.add_argument('-screen_threshold', type=float, default=0.0, help='With -screen_model, lowest decision function score to download. 0 keeps everything it labels include')
+    parser.add_argument('-search_cache', type=str, default=retrieval.search_cache.DEFAULT_PATH, help="SQLite file caching search results between runs, so repeated queries don't use API quota. Pass '' to disable")
+    parser.add_argument('-search_ttl_days', type=float, default=7, help='Days cached search results are used for before searching again')
+    parser.add_argument('-refresh_search', action='store_true', help='Search again even if the search cache has the results')
+    parser.add_argument('-max_pdf_mb', type=float, default=100, help='Skip PDFs larger than this many megabytes')
+    parser.add_argument('-redownload', action='store_true', help='Download every result again, even if the PDF folder already has it')
+    parser.add_argument('-pdf_store', type=str, help='Folder for a shared store that keeps one copy of each PDF and links it into every pdf_folder')
+    parser.add_argument('-host_rate', type=float, default=2.0, help='Requests per second each host starts out allowed; adapts to 429/503 responses')
+    parser.add_argument('-item_deadline', type=float, default=120, help='Seconds each result may take to download before it is given up on. 0 for no limit')
+    parser.add_argument('-pipeline', action='store_true', help='Start downloading results while the search is still paging through them')
+    parser.add_argument('-results_files', nargs='*', help='Results JSON files saved by earlier searches, for mode=download or mode=dedup')
+    parser.add_argument('-merged_file', type=str, help='With mode=dedup, where to save the merged results (.json or .jsonl)')
+    parser.add_argument('-exact_only', action='store_true', help='With mode=dedup, only merge results with the same DOI, PubMed ID or title and year, not near-duplicate titles and abstracts')
+    parser.add_argument('-only', type=str, choices=[retrieval.results.MISSING, retrieval.results.FAILED], help="With mode=download, only download results whose PDF is missing from pdf_folder, or which failed last time")
+    parser.add_argument('-ledger', type=str, help='failures_<label>.jsonl file from an earlier run, for mode=retry')
+    parser.add_argument('-retry_codes', nargs='*', help='Only retry failures with these reason codes, e.g. timeout http_status')
+    parser.add_argument('-cassette', type=str, help='Record every HTTP exchange to this file, or replay them from it')
+    parser.add_argument('-cassette_mode', type=str, default='auto', choices=retrieval.cassette.MODES, help="'record' always uses the network, 'replay' never does, 'auto' replays what it can and records the rest")
+    parser.add_argument('-grabber_plugins', nargs='*', default=[], help='Modules defining extra grabbers to register before downloading')
 
     args = parser.parse_args()
 
-    
+    retrieval.grab.load_grabber_plugins(args.grabber_plugins)
+
+    if args.cassette:
+        retrieval.cassette.Cassette(args.cassette, args.cassette_mode).install()
+
+    max_pdf_size = int(args.max_pdf_mb * 1024 * 1024)
+
+    search_cache = None
+    if args.search_cache:
+        search_cache = retrieval.search_cache.SearchCache(args.search_cache,
+                                                          ttl=args.search_ttl_days * retrieval.search_cache.DAY)
 
     if args.mode == 'single':
         print(f'Submitting {args.label} query...')
@@ -49,11 +90,52 @@ if __name__ == '__main__':
                           search_phrase=args.query,
                           date_range=(args.start_year, args.end_year),
                           results_file=args.json_file,
-                          max_results=args.max_results)
+                          max_results=args.max_results,
+                          cache=search_cache,
+                          refresh=args.refresh_search)
 
-        searcher.run()
+        if not args.pipeline:
+            searcher.run()
+
+        retrieval.grab.download(searcher, args.pdf_folder, workers=args.workers, per_host=args.per_host, doi_cache=args.doi_cache,
+                                max_pdf_size=max_pdf_size, resume=not args.redownload, pdf_store=args.pdf_store,
+                                host_rate=args.host_rate, pipeline=args.pipeline, item_deadline=args.item_deadline or None,
+                                domain_stats=args.domain_stats, skip_hosts=args.skip_hosts,
+                                screen_model=args.screen_model, screen_threshold=args.screen_threshold)
+
+    if args.mode == 'retry':
+        if not args.ledger or not args.pdf_folder:
+            parser.error('-ledger and -pdf_folder are required for mode=retry')
+
+        retrieval.grab.retry(args.ledger, args.pdf_folder, codes=args.retry_codes, workers=args.workers,
+                             per_host=args.per_host, doi_cache=args.doi_cache, max_pdf_size=max_pdf_size,
+                             resume=not args.redownload, pdf_store=args.pdf_store, host_rate=args.host_rate,
+                             item_deadline=args.item_deadline or None, domain_stats=args.domain_stats,
+                             skip_hosts=args.skip_hosts)
+
+    if args.mode == 'download':
+        if not args.results_files or not args.pdf_folder:
+            parser.error('-results_files and -pdf_folder are required for mode=download')
+
+        for results_file in args.results_files:
+            print(f'Downloading results from {results_file}...')
+
+            saved = retrieval.results.SavedResults(results_file, args.pdf_folder, only=args.only)
+
+            # Results are read from the file a few at a time as the downloads go
+            retrieval.grab.download(saved, args.pdf_folder, workers=args.workers, per_host=args.per_host,
+                                    doi_cache=args.doi_cache, max_pdf_size=max_pdf_size, resume=not args.redownload,
+                                    pdf_store=args.pdf_store, host_rate=args.host_rate, pipeline=True,
+                                    item_deadline=args.item_deadline or None, domain_stats=args.domain_stats,
+                                    skip_hosts=args.skip_hosts, screen_model=args.screen_model,
+                                    screen_threshold=args.screen_threshold)
+
+    if args.mode == 'dedup':
+        if not args.results_files or not args.merged_file:
+            parser.error('-results_files and -merged_file are required for mode=dedup')
 
-        retrieval.grab.download(searcher, args.pdf_folder)
+        retrieval.dedup.merge_results_files(args.results_files, args.merged_file, label=args.label,
+                                            near_duplicates=not args.exact_only)
 
     if args.mode == 'batch':
         if not args.csv_file:
@@ -68,32 +150,44 @@ if __name__ == '__main__':
                     Missing : {[i for i in ['engine', 'json_file', 'max_results', 'label', 'start_year', 'end_year', 'query', 'pdf_folder'] if i not in items.columns]}")
 
 
-        # WOS has a rate limit of 1 request per minute.
-        # Problematic when queries finish too fast, such as when few results.
-
-        for _, r in items.iterrows():
-
-            start_t = datetime.datetime.now()
-
-            do_query(engine = engines[r.engine],
-                     json_file = r.json_file,
-                     max_results = int(r.max_results),
-                     label = r.label,
-                     year_range = (r.start_year, r.end_year),
-                     query = r.query,
-                     pdf_folder = r.pdf_folder)
-
-            finish_t = datetime.datetime.now()
-
-            delta = finish_t - start_t
-
-            if delta.seconds <= 60:
-                time.sleep(80 - delta.seconds)
-
-
-
-
-
-
-
-
+        # Each engine has its own queue and rate limit (WoS allows about 1 query per minute), and the
+        # engines' queues run at the same time. See retrieval/schedule.py.
+
+        def run_row(r):
+            do_query(engine = retrieval.engines[r['engine']],
+                     json_file = r['json_file'],
+                     max_results = int(r['max_results']),
+                     label = r['label'],
+                     year_range = (r['start_year'], r['end_year']),
+                     query = r['query'],
+                     pdf_folder = r['pdf_folder'],
+                     workers = args.workers,
+                     per_host = args.per_host,
+                     doi_cache = args.doi_cache,
+                     max_pdf_size = max_pdf_size,
+                     resume = not args.redownload,
+                     pdf_store = args.pdf_store,
+                     host_rate = args.host_rate,
+                     pipeline = args.pipeline,
+                     item_deadline = args.item_deadline or None,
+                     domain_stats = args.domain_stats,
+                     skip_hosts = args.skip_hosts,
+                     screen_model = args.screen_model,
+                     screen_threshold = args.screen_threshold,
+                     search_cache = search_cache,
+                     refresh_search = args.refresh_search)
+
+        rows = items.to_dict('records')
+
+        unknown = {r['engine'] for r in rows} - set(retrieval.engines)
+        if unknown:
+            parser.error(f"Unknown engines in CSV file: {sorted(unknown)}. Expected one of {sorted(retrieval.engines)}")
+
+        scheduler = retrieval.schedule.EngineScheduler(run_row)
+        scheduler.run(rows)
+
+        if scheduler.failures:
+            print(f"{len(scheduler.failures)} queries failed: {[r['label'] for r, _ in scheduler.failures]}")
+
+    if search_cache is not None:
+        search_cache.close()
@@ -0,0 +1,126 @@
+"""
+Tests for the circuit breaker's half-open probe and the per-host slots in retrieval/web.py.
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from retrieval import web
+
+URL = 'http://publisher.example/article'
+
+
+class Response:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.is_redirect = False
+
+    def close(self):
+        pass
+
+
+class BreakerProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.breakers = web.CircuitBreaker(threshold=1, cooldown=0.01)
+        self.rate_limits = web.RateLimiter(rate=1000.0, max_rate=1000.0)
+
+        patches = [mock.patch.object(web, 'BREAKERS', self.breakers),
+                   mock.patch.object(web, 'RATE_LIMITS', self.rate_limits),
+                   mock.patch.object(web, 'RETRIES', 0)]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        # Open the circuit, then let the cooldown pass so the next request is the half-open probe
+        self.breakers.failure(URL)
+        time.sleep(0.02)
+
+    def probing(self) -> bool:
+        return self.breakers._hosts[web.host_of(URL)][2]
+
+    def test_probe_success_closes_the_circuit(self):
+        with mock.patch.object(web, '_send', return_value=Response(200)):
+            self.assertEqual(web.get(URL).status_code, 200)
+
+        self.assertFalse(self.breakers.is_open(URL))
+
+    def test_probe_failure_reopens_the_circuit(self):
+        with mock.patch.object(web, '_send', side_effect=requests.ConnectionError('reset')):
+            with self.assertRaises(requests.ConnectionError):
+                web.get(URL)
+
+        self.assertTrue(self.breakers.is_open(URL))
+        self.assertFalse(self.probing())
+
+    def test_probe_released_when_rate_limit_passes_the_deadline(self):
+        self.rate_limits.bucket(URL).blocked_until = time.monotonic() + 60
+
+        with self.assertRaises(requests.Timeout):
+            web.get(URL, deadline=time.monotonic() + 1)
+
+        self.assertFalse(self.probing())
+
+        # The next request after the cooldown may probe again rather than failing with HostUnavailable
+        self.rate_limits.bucket(URL).blocked_until = 0.0
+        time.sleep(0.02)
+
+        with mock.patch.object(web, '_send', return_value=Response(200)):
+            self.assertEqual(web.get(URL).status_code, 200)
+
+    def test_probe_settled_when_connection_error_is_near_the_deadline(self):
+        with mock.patch.object(web, 'RETRIES', 3), \
+                mock.patch.object(web, '_send', side_effect=requests.ConnectionError('reset')), \
+                mock.patch.object(web, 'backoff', return_value=10.0):
+            with self.assertRaises(requests.ConnectionError):
+                web.get(URL, deadline=time.monotonic() + 1)
+
+        self.assertFalse(self.probing())
+
+    def test_probe_settled_when_busy_response_is_near_the_deadline(self):
+        with mock.patch.object(web, 'RETRIES', 3), \
+                mock.patch.object(web, '_send', return_value=Response(500)), \
+                mock.patch.object(web, 'backoff', return_value=10.0):
+            self.assertEqual(web.get(URL, deadline=time.monotonic() + 1).status_code, 500)
+
+        self.assertFalse(self.probing())
+
+
+class HostSlotTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(web, 'HOST_LIMITS', web.HostLimiter(per_host=1))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_slot_wait_stops_at_the_deadline(self):
+        release = web.HOST_LIMITS.acquire(URL)
+        self.addCleanup(release)
+        start = time.monotonic()
+
+        with self.assertRaises(requests.Timeout):
+            with web.HOST_LIMITS.slot(URL, deadline=start + 0.1):
+                pass
+
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_slot_timeout_is_not_held_against_the_host(self):
+        breakers = web.CircuitBreaker(threshold=1, cooldown=60.0)
+        release = web.HOST_LIMITS.acquire(URL)
+        self.addCleanup(release)
+
+        with mock.patch.object(web, 'BREAKERS', breakers), \
+                mock.patch.object(web, 'SESSION') as session:
+            with self.assertRaises(web.SlotTimeout):
+                web.get(URL, deadline=time.monotonic() + 0.1)
+
+        session.get.assert_not_called()
+        self.assertFalse(breakers.is_open(URL))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+Near-duplicate detection over titles and abstracts with MinHash and locality-sensitive hashing.
+
+The same paper found by different engines, or uploaded twice to Zotero, rarely has byte-identical
+metadata: casing, punctuation, markup, subtitles and truncated abstracts all differ. Each record's
+title (and the start of its abstract) is cut into overlapping character shingles. The bands of a
+MinHash signature of the title shingles are hashed into buckets, so a record is only compared with
+the few records that share a bucket with it, rather than with every other one, which keeps hundreds
+of thousands of records tractable. Those candidates are then compared on the exact Jaccard similarity
+of their shingles, since the MinHash estimate is only good to about 0.06.
+
+Records are duplicates if:
+  - they share a DOI or another exact identifier passed in `ids`, or
+  - both have abstracts, their titles are at least TITLE_THRESHOLD similar and the starts of their
+    title + abstract at least TEXT_THRESHOLD similar, or
+  - either has no abstract and their titles are at least TITLE_ONLY_THRESHOLD similar.
+
+Records with different DOIs are never duplicates, and neither are similar records from different
+years (e.g. the 2015 and 2016 editions of an annual report), nor anything that would put two such
+records in the same cluster.
+
+Clusters of duplicates are what api.zotero_api.remove_duplicates and retrieval/dedup.py consume.
+"""
+import re
+from typing import Hashable, Iterable, List, Optional
+
+import numpy as np
+
+# Characters per shingle
+SHINGLE_SIZE = 5
+
+# Only the start of an abstract is compared, since some engines truncate them
+ABSTRACT_PREFIX = 250
+
+# MinHash permutations, split into LSH bands of NUM_PERM // BANDS rows. With 16 bands of 4, two titles
+# that are 0.7 similar share a bucket with probability 0.99, and ones that are 0.3 similar rarely do.
+NUM_PERM = 64
+BANDS = 16
+
+# Shingle similarity is harsh on short titles: dropping 'a' and adding 'the' to a seven word title
+# leaves it about 0.7 similar, so the title threshold is low when the abstracts agree as well
+TITLE_THRESHOLD = 0.7
+TEXT_THRESHOLD = 0.7
+TITLE_ONLY_THRESHOLD = 0.9
+
+# Records compared per bucket at most, so that a bucket of near-identical generic titles can't go quadratic
+MAX_BUCKET = 50
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_BASE = np.uint64(257)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalise_text(text: str) -> str:
+    """lower-cases text and drops markup and punctuation, leaving single spaces between words"""
+    text = re.sub(r'<[^>]+>', ' ', text or '')
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """returns the distinct 32 bit hashes of the overlapping shingles of text's UTF-8 bytes"""
+    data = np.frombuffer(text.encode(), dtype=np.uint8).astype(np.uint64)
+    if not len(data):
+        return data
+    size = min(size, len(data))
+    # polynomial hash of every window of `size` bytes at once, then spread over the high bits
+    hashes = np.zeros(len(data) - size + 1, dtype=np.uint64)
+    for k in range(size):
+        hashes = hashes * _SHINGLE_BASE + data[k:len(data) - size + 1 + k]
+    return np.unique((hashes * _GOLDEN) >> np.uint64(32))
+
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, title_threshold: float = TITLE_THRESHOLD,
+                 text_threshold: float = TEXT_THRESHOLD, title_only_threshold: float = TITLE_ONLY_THRESHOLD,
+                 seed: int = 1):
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        self.bands, self.rows = bands, num_perm // bands
+        self.title_threshold = title_threshold
+        self.text_threshold = text_threshold
+        self.title_only_threshold = title_only_threshold
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.randint(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+
+        self.keys = []  # record index -> the key it was added with
+        self._titles, self._abstracts = [], []  # record index -> shingle hashes, or None for no abstract
+        self._buckets = [dict() for _ in range(bands)]  # band -> band hash -> record indices
+        self._ids = {}  # exact identifier -> first record index with it
+        self._parent = {}
+        self._dois, self._years = {}, {}  # cluster root -> DOIs / years of the records in the cluster
+
+    def signature(self, hashes: np.ndarray):
+        """returns the MinHash signature of an array of shingle hashes, or None if it is empty"""
+        if not len(hashes):
+            return None
+        hv = hashes[None, :]
+        # uint64 products wrap around, which is harmless for hashing
+        return np.bitwise_and((self._a * hv + self._b) % _PRIME, _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    @staticmethod
+    def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+        """exact Jaccard similarity of two arrays of distinct shingle hashes"""
+        union = len(np.union1d(a, b))
+        return len(np.intersect1d(a, b, assume_unique=True)) / union if union else 0.0
+
+    def _find(self, i: int) -> int:
+        while self._parent.get(i, i) != i:
+            i = self._parent[i]
+        return i
+
+    def _conflict(self, i: int, j: int, years: bool = True) -> bool:
+        """whether the clusters of two records hold different DOIs, or (with years) only different years"""
+        i, j = self._find(i), self._find(j)
+        if self._dois[i] and self._dois[j] and not self._dois[i] & self._dois[j]:
+            return True
+        return years and bool(self._years[i] and self._years[j] and not self._years[i] & self._years[j])
+
+    def _union(self, i: int, j: int):
+        i, j = self._find(i), self._find(j)
+        if i != j:
+            root, child = min(i, j), max(i, j)
+            self._parent[child] = root
+            self._dois[root] |= self._dois.pop(child)
+            self._years[root] |= self._years.pop(child)
+
+    def is_duplicate(self, i: int, j: int) -> bool:
+        """compares two records that have both been added, by index"""
+        if self._conflict(i, j):
+            return False
+        title_sim = self.jaccard(self._titles[i], self._titles[j])
+        if self._abstracts[i] is not None and self._abstracts[j] is not None:
+            return title_sim >= self.title_threshold and \
+                self.jaccard(np.union1d(self._titles[i], self._abstracts[i]),
+                             np.union1d(self._titles[j], self._abstracts[j])) >= self.text_threshold
+        return title_sim >= self.title_only_threshold
+
+    def add(self, key: Hashable, title: str, abstract: str = None, ids: Iterable = (), doi: str = None,
+            year: Optional[int] = None) -> int:
+        """adds a record and links it to any earlier duplicates. Returns its index. A DOI is matched exactly
+        like ids, and keeps the record apart from ones with other DOIs; so does a year from other years"""
+        i = len(self.keys)
+        self.keys.append(key)
+
+        doi = (doi or "").strip().lower()
+        self._dois[i] = {doi} if doi else set()
+        self._years[i] = {str(year)} if year else set()
+
+        for identifier in list(ids) + (["doi:" + doi] if doi else []):
+            # the same identifier is the same paper, whatever years it was given
+            if identifier and not self._conflict(self._ids.setdefault(identifier, i), i, years=False):
+                self._union(self._ids[identifier], i)
+
+        title, abstract = normalise_text(title), normalise_text(abstract)[:ABSTRACT_PREFIX]
+        title_shingles = shingles(title).astype(np.uint32)
+        title_sig = self.signature(title_shingles)
+        self._titles.append(title_shingles)
+        self._abstracts.append(shingles(abstract).astype(np.uint32) if abstract and title_sig is not None else None)
+
+        if title_sig is None:
+            # Nothing to compare on but the ids
+            return i
+
+        compared = set()
+        for band, buckets in enumerate(self._buckets):
+            bucket = buckets.setdefault(hash(title_sig[band * self.rows:(band + 1) * self.rows].tobytes()), [])
+            for j in bucket:
+                if j not in compared:
+                    compared.add(j)
+                    if self._find(i) != self._find(j) and self.is_duplicate(i, j):
+                        self._union(i, j)
+            if len(bucket) < MAX_BUCKET:
+                bucket.append(i)
+
+        return i
+
+    def clusters(self) -> List[List[Hashable]]:
+        """returns the keys of every group of duplicates with more than one record, each in the order they
+        were added, groups in order of their first record"""
+        groups = {}
+        for i in range(len(self.keys)):
+            groups.setdefault(self._find(i), []).append(self.keys[i])
+        return [group for group in groups.values() if len(group) > 1]
+